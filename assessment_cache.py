@@ -0,0 +1,184 @@
+"""
+CKD Assessment Cache Module
+
+This module caches finished assessments under a canonical form of the
+patient's answers, so identical questionnaire submissions are answered
+without running the agent crew again.
+
+Features:
+- Canonical key from the locally parsed models.PatientData (plus the
+  maybe/sometimes fields and any unparsed answers), so wording and
+  question order differences that parse the same share an entry
+- Key also covers the LLM model, pipeline profile and route
+- SQLite store with a time-to-live and a maximum number of entries,
+  evicting the least recently used
+- Hit/miss counters for monitoring
+
+Usage:
+    python assessment_cache.py
+    python assessment_cache.py --clear
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+from models import ParsedPatientData
+
+logger = logging.getLogger(__name__)
+
+ASSESSMENT_CACHE_PATH = os.getenv("CKD_ASSESSMENT_CACHE", "./assessment_cache/assessments.sqlite3")
+ASSESSMENT_CACHE_ENABLED = os.getenv("CKD_ASSESSMENT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ASSESSMENT_CACHE_TTL_SECONDS = float(os.getenv("CKD_ASSESSMENT_CACHE_TTL_HOURS", "168")) * 3600
+ASSESSMENT_CACHE_SIZE = int(os.getenv("CKD_ASSESSMENT_CACHE_SIZE", "1000"))
+
+def canonical_answers(parsed: ParsedPatientData) -> Dict[str, Any]:
+    """Return the canonical, order-independent form of a patient's answers"""
+    return {
+        "patient_data": parsed.patient_data.model_dump(mode="json"),
+        "maybe_fields": sorted(parsed.maybe_fields),
+        "unparsed_fields": {field: " ".join(str(answer).lower().split())
+                            for field, answer in sorted(parsed.unparsed_fields.items())}
+    }
+
+def assessment_key(parsed: ParsedPatientData, model: str, profile: str, route: str) -> str:
+    """Return the cache key of an assessment"""
+    payload = {"answers": canonical_answers(parsed), "model": model, "profile": profile, "route": route}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+class AssessmentCache:
+    """SQLite-backed store of finished assessments with TTL and LRU size limit"""
+
+    def __init__(self, path: str = ASSESSMENT_CACHE_PATH, max_entries: int = ASSESSMENT_CACHE_SIZE,
+                 ttl_seconds: Optional[float] = ASSESSMENT_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS assessments (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached assessment of a key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, metadata, created_at, hit_count FROM assessments WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds is not None and row[2] + self.ttl_seconds <= now:
+                self._conn.execute("DELETE FROM assessments WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE assessments SET last_used = ?, hit_count = hit_count + 1 WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return {"result": row[0], "metadata": json.loads(row[1]), "created_at": row[2], "hit_count": row[3] + 1}
+
+    def put(self, key: str, result: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Store a finished assessment, dropping expired and least recently used entries"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO assessments (key, result, metadata, created_at, last_used, hit_count) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                (key, result, json.dumps(metadata or {}), now, now)
+            )
+            if self.ttl_seconds is not None:
+                self._conn.execute("DELETE FROM assessments WHERE created_at <= ?", (now - self.ttl_seconds,))
+            count = self._conn.execute("SELECT COUNT(*) FROM assessments").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM assessments WHERE key IN (SELECT key FROM assessments ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                self.evictions += count - self.max_entries
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Delete every cached assessment"""
+        with self._lock:
+            self._conn.execute("DELETE FROM assessments")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters of this process and the number of stored assessments"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM assessments").fetchone()[0]
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+_shared_cache: Optional[AssessmentCache] = None
+_shared_cache_lock = threading.Lock()
+
+def get_assessment_cache() -> AssessmentCache:
+    """Return the process-wide assessment cache"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = AssessmentCache()
+        return _shared_cache
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="CKD Assessment Cache")
+
+    parser.add_argument('--clear', action='store_true',
+                       help='Delete every cached assessment')
+
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    try:
+        cache = get_assessment_cache()
+        if args.clear:
+            cache.clear()
+            logger.info(f"Cleared assessment cache {cache.path}")
+        stats = cache.stats()
+        logger.info(f"Assessment cache {cache.path}: {stats['entries']} of {stats['max_entries']} entries")
+        return 0
+    except Exception as e:
+        logger.error(f"Assessment cache command failed: {e}")
+        return 1
+
+if __name__ == "__main__":
+    exit(main())
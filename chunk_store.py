@@ -0,0 +1,200 @@
+"""
+CKD Chunk Store Module
+
+This module provides the provider-independent store of parsed and split
+knowledge base chunks. Every per-provider vector index references chunks
+by the ids assigned here, so a source file is parsed once no matter how
+many embedding providers index it.
+
+Features:
+- SQLite store of chunk text, source, page and metadata keyed by chunk id
+- Per-file content hash and chunking parameters to detect re-parses
+- Content-derived chunk ids shared by every provider
+- One place to list and inspect chunks
+
+Usage:
+    python chunk_store.py
+    python chunk_store.py --source data/KDIGO-2024-CKD-Guideline.pdf
+    python chunk_store.py --chunk <chunk_id>
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+CHUNK_STORE_PATH = os.getenv("CKD_CHUNK_STORE", "./chunk_store/chunks.sqlite3")
+
+def chunk_hash(source: str, page: Any, text: str) -> str:
+    """Return a stable id for a chunk from its source, page and content"""
+    payload = f"{source}\x00{page if page is not None else ''}\x00{text.strip()}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ChunkStore:
+    """SQLite-backed store of parsed source files and their chunks"""
+
+    def __init__(self, path: str = CHUNK_STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS files (
+                source TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                chunk_size INTEGER NOT NULL,
+                chunk_overlap INTEGER NOT NULL,
+                chunk_count INTEGER NOT NULL,
+                parsed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                page INTEGER,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source, position);"""
+        )
+        self._conn.commit()
+
+    def list_files(self) -> Dict[str, Dict[str, Any]]:
+        """Return the parse record of every stored source file"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, sha256, chunk_size, chunk_overlap, chunk_count, parsed_at FROM files ORDER BY source"
+            ).fetchall()
+        return {
+            source: {"sha256": sha256, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap,
+                     "chunk_count": chunk_count, "parsed_at": parsed_at}
+            for source, sha256, chunk_size, chunk_overlap, chunk_count, parsed_at in rows
+        }
+
+    def replace_file(self, source: str, sha256: str, chunk_size: int, chunk_overlap: int,
+                     chunks: List[Document]) -> List[str]:
+        """Replace the chunks of a source file with a fresh parse
+
+        Chunks with identical source, page and content are stored once.
+        Returns the ids of the stored chunks in document order.
+        """
+        rows = []
+        seen = set()
+        for chunk in chunks:
+            chunk.metadata["source"] = source
+            chunk_id = chunk_hash(source, chunk.metadata.get("page"), chunk.page_content)
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            chunk.metadata["chunk_id"] = chunk_id
+            page = chunk.metadata.get("page")
+            rows.append((chunk_id, source, len(rows), page if isinstance(page, int) else None,
+                         chunk.page_content, json.dumps(chunk.metadata)))
+
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (chunk_id, source, position, page, text, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO files (source, sha256, chunk_size, chunk_overlap, chunk_count, parsed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (source, sha256, chunk_size, chunk_overlap, len(rows), time.time())
+                )
+        return [row[0] for row in rows]
+
+    def remove_file(self, source: str) -> None:
+        """Delete a source file and all of its chunks"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+                self._conn.execute("DELETE FROM files WHERE source = ?", (source,))
+
+    def get_chunks(self, source: Optional[str] = None) -> List[Document]:
+        """Return the chunks of one source file, or of every file, in document order"""
+        query = "SELECT text, metadata FROM chunks"
+        params = ()
+        if source is not None:
+            query += " WHERE source = ?"
+            params = (source,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY source, position", params).fetchall()
+        return [Document(page_content=text, metadata=json.loads(metadata)) for text, metadata in rows]
+
+    def get_chunk(self, chunk_id: str) -> Optional[Document]:
+        """Return a single chunk by id, or None if it is not stored"""
+        with self._lock:
+            row = self._conn.execute("SELECT text, metadata FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+        if row is None:
+            return None
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of stored files, chunks and characters"""
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            chunks, characters = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(text)), 0) FROM chunks").fetchone()
+        return {"files": files, "chunks": chunks, "characters": characters}
+
+_shared_store: Optional[ChunkStore] = None
+_shared_store_lock = threading.Lock()
+
+def get_chunk_store() -> ChunkStore:
+    """Return the process-wide chunk store"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = ChunkStore()
+        return _shared_store
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="CKD Chunk Store Inspection")
+
+    parser.add_argument('--source', type=str,
+                       help='List the chunks of one source file')
+    parser.add_argument('--chunk', type=str,
+                       help='Print a single chunk by id')
+
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+
+    try:
+        store = get_chunk_store()
+        if args.chunk:
+            chunk = store.get_chunk(args.chunk)
+            if chunk is None:
+                print(f"No chunk with id {args.chunk}")
+                return 1
+            print(json.dumps(chunk.metadata, indent=2))
+            print(chunk.page_content)
+        elif args.source:
+            for chunk in store.get_chunks(os.path.normpath(args.source)):
+                preview = " ".join(chunk.page_content.split())[:100]
+                print(f"{chunk.metadata['chunk_id'][:12]}  p{chunk.metadata.get('page', '-')}  {preview}")
+        else:
+            print(f"Chunk store {store.path}: {store.stats()}")
+            for source, info in store.list_files().items():
+                print(f"{source}: {info['chunk_count']} chunks (size {info['chunk_size']}, overlap {info['chunk_overlap']})")
+        return 0
+    except Exception as e:
+        print(f"Chunk store inspection failed: {e}")
+        return 1
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,189 @@
+"""
+CKD Historical Cohort Module
+
+This module indexes the historical patient responses so the research agent
+sees the past patients most similar to the current one instead of a fixed
+sample of the first records.
+
+Features:
+- Columnar cohort held in NumPy arrays: patient ids, gender and compact
+  ordinal feature matrices (uint8: age decade, and 0/1/2 for
+  absent/maybe/present risk factors) of the past and present responses
+- Parsed once per process and reloaded when a response file's mtime or
+  size changes
+- Vectorized k-nearest-neighbour lookup with a weighted L1 distance whose
+  weights are the clinical prior weights of risk_scoring, so a mismatch in
+  hypertension counts more than one in appetite
+- Neighbours are searched on the past (1 year ago) responses and returned
+  with the same patients' present responses, or rendered as a compact
+  table of their factors
+
+Usage:
+    python cohort.py
+    python cohort.py --responses answers.json --k 5
+"""
+
+import os
+import json
+import argparse
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models import ParsedPatientData
+from query_cache import LRUCache
+from patient_parser import parse_patient_responses
+from risk_scoring import FEATURES, FEATURE_NAMES, featurize, PAST_RESPONSES_PATH, PRESENT_RESPONSES_PATH, MAYBE_WEIGHT
+
+logger = logging.getLogger(__name__)
+
+SIMILAR_PATIENTS_K = 5
+SIMILAR_TABLE_CACHE_SIZE = 256
+GENDERS = ["male", "female", "other"]
+AGE_INDEX = FEATURE_NAMES.index("age")
+# Distance weight per ordinal step: one age decade, or absent -> maybe -> present
+FEATURE_WEIGHTS = np.array([prior for _, _, prior in FEATURES], dtype=np.float32)
+
+def source_stats(paths: List[str]) -> Tuple:
+    """Return the (mtime, size) of each source file, used to detect changes"""
+    return tuple((os.path.getmtime(path), os.path.getsize(path)) for path in paths)
+
+def encode(parsed: ParsedPatientData) -> np.ndarray:
+    """Return the ordinal uint8 code vector of a parsed patient, derived from risk_scoring.featurize"""
+    codes = np.rint(featurize(parsed) / MAYBE_WEIGHT)
+    codes[AGE_INDEX] = (parsed.patient_data.demographics.age or 0) // 10
+    return codes.astype(np.uint8)
+
+def encode_many(patients: Sequence[Any]) -> np.ndarray:
+    """Return the (patients x features) code matrix of response lists or ParsedPatientData"""
+    rows = [encode(patient if isinstance(patient, ParsedPatientData) else parse_patient_responses(patient))
+            for patient in patients]
+    return np.vstack(rows) if rows else np.zeros((0, len(FEATURES)), dtype=np.uint8)
+
+class CohortIndex:
+    """Columnar historical cohort: patient ids, gender and past/present codes for similarity search"""
+
+    def __init__(self, past: List[Dict[str, Any]], present: List[Dict[str, Any]], fingerprint: Tuple = ()):
+        present_by_id = {patient["patient_id"]: patient["responses"] for patient in present}
+        parsed_past = [parse_patient_responses(patient["responses"]) for patient in past]
+        self.fingerprint = fingerprint
+        self.patient_ids = np.array([patient["patient_id"] for patient in past], dtype=np.int64)
+        self.genders = np.array([GENDERS.index(parsed.patient_data.demographics.gender)
+                                 if parsed.patient_data.demographics.gender in GENDERS else len(GENDERS)
+                                 for parsed in parsed_past], dtype=np.uint8)
+        self.codes = encode_many(parsed_past)
+        self.has_present = np.array([patient["patient_id"] in present_by_id for patient in past], dtype=bool)
+        self.present_codes = encode_many([present_by_id.get(patient["patient_id"], []) for patient in past])
+        self._tables = LRUCache(max_size=SIMILAR_TABLE_CACHE_SIZE, ttl_seconds=None)
+
+    @classmethod
+    def load(cls, past_path: str = PAST_RESPONSES_PATH, present_path: str = PRESENT_RESPONSES_PATH) -> "CohortIndex":
+        """Build the index from the historical response files"""
+        fingerprint = source_stats([past_path, present_path])
+        with open(past_path, "r", encoding="utf-8") as f:
+            past = json.load(f)
+        with open(present_path, "r", encoding="utf-8") as f:
+            present = json.load(f)
+        index = cls(past, present, fingerprint)
+        logger.info(f"Indexed {len(past)} historical patients for similarity search")
+        return index
+
+    def __len__(self) -> int:
+        return len(self.patient_ids)
+
+    def distances(self, query: np.ndarray) -> np.ndarray:
+        """Weighted L1 distance of every historical patient to a code vector"""
+        diff = np.abs(self.codes.astype(np.int16) - query.astype(np.int16))
+        return diff @ FEATURE_WEIGHTS
+
+    def nearest_codes(self, query: np.ndarray, k: int = SIMILAR_PATIENTS_K) -> List[Tuple[int, float]]:
+        """Return (row, distance) of the k patients closest to a code vector; ties keep file order"""
+        if len(self) == 0 or k <= 0:
+            return []
+        distances = self.distances(query)
+        k = min(k, len(self))
+        kth = np.partition(distances, k - 1)[k - 1]
+        closer = np.flatnonzero(distances < kth)
+        candidates = np.concatenate([closer, np.flatnonzero(distances == kth)[:k - len(closer)]])
+        order = candidates[np.lexsort((candidates, distances[candidates]))]
+        return [(int(row), float(distances[row])) for row in order]
+
+    def nearest(self, patient: Any, k: int = SIMILAR_PATIENTS_K) -> List[Tuple[int, float]]:
+        """Return (row, distance) of the k patients most similar to a response list or ParsedPatientData"""
+        parsed = patient if isinstance(patient, ParsedPatientData) else parse_patient_responses(patient)
+        return self.nearest_codes(encode(parsed), k)
+
+    def format_similar_patients(self, patient_responses_json: str, k: int = SIMILAR_PATIENTS_K) -> str:
+        """Render the k patients most similar to JSON responses as a markdown table; "?" marks maybe answers
+
+        Tables are memoized per answers for the lifetime of the index.
+        """
+        key = (patient_responses_json, k)
+        table = self._tables.get(key)
+        if table is None:
+            table = self._format_similar_patients(json.loads(patient_responses_json), k)
+            self._tables.put(key, table)
+        return table
+
+    def _format_similar_patients(self, patient: Any, k: int) -> str:
+        lines = ["| Patient | Age | Factors 1 year ago | Factors now |", "|---|---|---|---|"]
+        for row, _ in self.nearest(patient, k):
+            now = _format_codes(self.present_codes[row]) if self.has_present[row] else "n/a"
+            lines.append(f"| {self.patient_ids[row]} | {self.codes[row][AGE_INDEX] * 10}s | {_format_codes(self.codes[row])} | {now} |")
+        return "\n".join(lines)
+
+def _format_codes(codes: np.ndarray) -> str:
+    names = [f"{name}{'?' if codes[i] == 1 else ''}" for i, (_, name, _) in enumerate(FEATURES) if i != AGE_INDEX and codes[i]]
+    return ", ".join(names) or "none"
+
+_index: Optional[CohortIndex] = None
+_index_lock = threading.Lock()
+
+def get_cohort_index(past_path: str = PAST_RESPONSES_PATH, present_path: str = PRESENT_RESPONSES_PATH) -> CohortIndex:
+    """Return the process-wide cohort index, reloaded when a response file's mtime or size changes"""
+    global _index
+    with _index_lock:
+        if _index is None or _index.fingerprint != source_stats([past_path, present_path]):
+            _index = CohortIndex.load(past_path, present_path)
+        return _index
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="CKD Similar Historical Patient Lookup")
+
+    parser.add_argument('--responses', type=str,
+                       help='JSON file with a list of {"question", "answer"} responses; defaults to the first past patient')
+    parser.add_argument('--k', type=int, default=SIMILAR_PATIENTS_K,
+                       help='Number of similar patients to return')
+
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    try:
+        index = get_cohort_index()
+        if args.responses:
+            with open(args.responses, "r", encoding="utf-8") as f:
+                responses = json.load(f)
+            for row, distance in index.nearest(responses, args.k):
+                print(f"patient {index.patient_ids[row]}: distance {distance:.2f}")
+            print(index.format_similar_patients(json.dumps(responses), args.k))
+        else:
+            for row, distance in index.nearest_codes(index.codes[0], args.k):
+                print(f"patient {index.patient_ids[row]}: distance {distance:.2f}")
+        return 0
+    except Exception as e:
+        logger.error(f"Similar patient lookup failed: {e}")
+        return 1
+
+if __name__ == "__main__":
+    exit(main())
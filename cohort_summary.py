@@ -0,0 +1,229 @@
+"""
+CKD Cohort Summary Module
+
+This module aggregates the historical patient responses into a compact
+summary for the research agent, so the size of its prompt no longer grows
+with the number of historical patients.
+
+Features:
+- Per-factor answer frequencies one year ago and now (yes/maybe/no)
+- Past-to-present transition rates per factor: new onset, persistence
+  and resolution
+- Most frequent co-occurring factor pairs with their lift
+- Age and gender distribution
+- Stored as a JSON artifact with the fingerprint of its source files and
+  rebuilt only when those files change
+- Rendered as compact markdown tables
+
+Usage:
+    python cohort_summary.py
+    python cohort_summary.py --rebuild
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cohort import CohortIndex, get_cohort_index, source_stats, AGE_INDEX, GENDERS
+from risk_scoring import FEATURES, PAST_RESPONSES_PATH, PRESENT_RESPONSES_PATH
+
+logger = logging.getLogger(__name__)
+
+COHORT_SUMMARY_PATH = os.getenv("CKD_COHORT_SUMMARY", "./cohort_summary/summary.json")
+COHORT_SUMMARY_VERSION = 1
+TOP_PAIRS = 8
+
+# Risk factors by index in the cohort code matrix, without age
+FACTORS = [(i, feature, name) for i, (feature, name, _) in enumerate(FEATURES) if i != AGE_INDEX]
+
+_summary_cache: Optional[Dict[str, Any]] = None
+_summary_text: Optional[Tuple[Dict[str, Any], str]] = None
+_summary_lock = threading.Lock()
+
+def _percent(count: float, total: float) -> float:
+    return round(100.0 * count / total, 1) if total else 0.0
+
+def source_fingerprint(paths: List[str]) -> str:
+    """Return a hash of the contents of the source files"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+def _source_stats(paths: List[str]) -> List[List[float]]:
+    return [list(stats) for stats in source_stats(paths)]
+
+def summarize(index: CohortIndex) -> Dict[str, Any]:
+    """Aggregate the historical cohort into answer frequencies, transitions and co-occurrences"""
+    past_codes = index.codes[index.has_present]
+    present_codes = index.present_codes[index.has_present]
+    total = len(past_codes)
+
+    factors = []
+    for i, feature, name in FACTORS:
+        before, after = past_codes[:, i], present_codes[:, i]
+        absent_before = int(np.sum(before == 0))
+        present_before = int(np.sum(before > 0))
+        factors.append({
+            "feature": feature,
+            "name": name,
+            "past": {"yes": _percent(np.sum(before == 2), total), "maybe": _percent(np.sum(before == 1), total)},
+            "present": {"yes": _percent(np.sum(after == 2), total), "maybe": _percent(np.sum(after == 1), total)},
+            "new_onset": _percent(np.sum((before == 0) & (after > 0)), absent_before),
+            "persisted": _percent(np.sum((before > 0) & (after > 0)), present_before),
+            "resolved": _percent(np.sum((before > 0) & (after == 0)), present_before)
+        })
+
+    # Co-occurrence of factors reported as present (yes or maybe) one year ago
+    flags = past_codes[:, [i for i, _, _ in FACTORS]] > 0
+    prevalence = flags.mean(axis=0) if total else np.zeros(len(FACTORS))
+    co_counts = flags.T.astype(np.int32) @ flags.astype(np.int32)
+    co_pairs = []
+    for a, b in combinations(range(len(FACTORS)), 2):
+        count = int(co_counts[a, b])
+        if count == 0:
+            continue
+        lift = (count / total) / (prevalence[a] * prevalence[b])
+        co_pairs.append({"factors": [FACTORS[a][2], FACTORS[b][2]], "percent": _percent(count, total), "lift": round(float(lift), 2)})
+    co_pairs.sort(key=lambda pair: (-pair["percent"], -pair["lift"]))
+
+    ages = np.array([code * 10 for code in past_codes[:, AGE_INDEX]]) if total else np.zeros(0)
+    genders = Counter((GENDERS + ["unknown"])[code] for code in index.genders[index.has_present].tolist())
+    return {
+        "patients": total,
+        "age_decades": {f"{decade}s": _percent(count, total) for decade, count in sorted(Counter(ages.astype(int).tolist()).items())},
+        "gender": {gender: _percent(count, total) for gender, count in genders.most_common()},
+        "factors": factors,
+        "co_occurrence": co_pairs[:TOP_PAIRS]
+    }
+
+def build_cohort_summary(past_path: str = PAST_RESPONSES_PATH, present_path: str = PRESENT_RESPONSES_PATH) -> Dict[str, Any]:
+    """Summarize the historical response files and store the summary artifact"""
+    paths = [past_path, present_path]
+    index = get_cohort_index(past_path, present_path)
+    summary = {
+        "version": COHORT_SUMMARY_VERSION,
+        "sources": paths,
+        "source_sha256": source_fingerprint(paths),
+        "source_stats": _source_stats(paths),
+        "built_at": datetime.now().isoformat(),
+        **summarize(index)
+    }
+
+    _store_summary(summary)
+    logger.info(f"Stored cohort summary of {summary['patients']} patients in {COHORT_SUMMARY_PATH}")
+    return summary
+
+def _store_summary(summary: Dict[str, Any]) -> None:
+    directory = os.path.dirname(COHORT_SUMMARY_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{COHORT_SUMMARY_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=1)
+    os.replace(tmp_path, COHORT_SUMMARY_PATH)
+
+def _is_current(summary: Dict[str, Any], paths: List[str]) -> bool:
+    """Whether a stored summary was built from the current source files
+
+    When only the mtime or size changed (e.g. after a touch or checkout) and
+    the contents hash still matches, the summary's source stats are updated
+    and stored, so later checks do not hash the files again.
+    """
+    if summary.get("version") != COHORT_SUMMARY_VERSION or summary.get("sources") != paths:
+        return False
+    stats = _source_stats(paths)
+    if summary.get("source_stats") == stats:
+        return True
+    if summary.get("source_sha256") != source_fingerprint(paths):
+        return False
+    summary["source_stats"] = stats
+    _store_summary(summary)
+    return True
+
+def get_cohort_summary(past_path: str = PAST_RESPONSES_PATH, present_path: str = PRESENT_RESPONSES_PATH) -> Dict[str, Any]:
+    """Return the cohort summary, rebuilding it only if the source files changed"""
+    global _summary_cache
+    paths = [past_path, present_path]
+    with _summary_lock:
+        if _summary_cache is not None and _is_current(_summary_cache, paths):
+            return _summary_cache
+        summary = None
+        try:
+            with open(COHORT_SUMMARY_PATH, "r", encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if summary is None or not _is_current(summary, paths):
+            summary = build_cohort_summary(past_path, present_path)
+        _summary_cache = summary
+        return summary
+
+def get_cohort_summary_text() -> str:
+    """Return the rendered cohort summary, re-rendered only when the summary is rebuilt"""
+    global _summary_text
+    summary = get_cohort_summary()
+    with _summary_lock:
+        if _summary_text is None or _summary_text[0] is not summary:
+            _summary_text = (summary, format_cohort_summary(summary))
+        return _summary_text[1]
+
+def format_cohort_summary(summary: Dict[str, Any]) -> str:
+    """Render a cohort summary as compact markdown tables"""
+    lines = [
+        f"{summary['patients']} patients, all diagnosed with CKD within one year of their past responses.",
+        "Age: " + ", ".join(f"{decade} {percent}%" for decade, percent in summary["age_decades"].items()),
+        "Gender: " + ", ".join(f"{gender} {percent}%" for gender, percent in summary["gender"].items()),
+        "",
+        "| Factor | Past yes/maybe % | Present yes/maybe % | New onset % | Persisted % | Resolved % |",
+        "|---|---|---|---|---|---|"
+    ]
+    for factor in summary["factors"]:
+        lines.append(
+            f"| {factor['name']} | {factor['past']['yes']}/{factor['past']['maybe']} | "
+            f"{factor['present']['yes']}/{factor['present']['maybe']} | {factor['new_onset']} | "
+            f"{factor['persisted']} | {factor['resolved']} |"
+        )
+    if summary["co_occurrence"]:
+        lines.extend(["", "| Co-occurring past factors | % of patients | Lift |", "|---|---|---|"])
+        lines.extend(f"| {' + '.join(pair['factors'])} | {pair['percent']} | {pair['lift']} |" for pair in summary["co_occurrence"])
+    return "\n".join(lines)
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="CKD Cohort Summary Builder")
+
+    parser.add_argument('--rebuild', action='store_true',
+                       help='Rebuild the summary even if the source files did not change')
+
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    try:
+        summary = build_cohort_summary() if args.rebuild else get_cohort_summary()
+        print(format_cohort_summary(summary))
+        return 0
+    except Exception as e:
+        logger.error(f"Building the cohort summary failed: {e}")
+        return 1
+
+if __name__ == "__main__":
+    exit(main())
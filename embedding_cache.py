@@ -0,0 +1,139 @@
+"""
+CKD Embedding Cache Module
+
+This module provides a persistent, on-disk cache of document embeddings so
+that unchanged chunks are never embedded twice, across rebuilds or machines.
+
+Features:
+- SQLite store keyed by (embedding model id, normalized chunk text hash)
+- Drop-in wrapper around any LangChain embeddings object
+- Only cache misses are sent to the underlying model, in one batch
+
+The cache file can be copied between machines; entries are only reused for
+the exact model id they were computed with.
+"""
+
+import os
+import re
+import hashlib
+import logging
+import sqlite3
+import threading
+from array import array
+from typing import Dict, List, Optional
+
+from langchain.embeddings.base import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_PATH = os.getenv("CKD_EMBEDDING_CACHE", "./embedding_cache/embeddings.sqlite3")
+LOOKUP_BATCH_SIZE = 500
+
+def normalize_text(text: str) -> str:
+    """Normalize chunk text so that whitespace-only differences share a cache entry"""
+    return re.sub(r"\s+", " ", text).strip()
+
+def text_hash(text: str) -> str:
+    """Return the cache key hash of a piece of text"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """SQLite-backed store of embedding vectors"""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )"""
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """Return the cached vectors for the given hashes that are present"""
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                batch = hashes[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                )
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        """Store vectors computed with a model"""
+        rows = [(model, key, len(vector), array("f", vector).tobytes()) for key, vector in vectors.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def count(self, model: Optional[str] = None) -> int:
+        """Return the number of cached vectors, optionally for a single model"""
+        with self._lock:
+            if model is None:
+                return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (model,)).fetchone()[0]
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that consults the on-disk cache before embedding documents"""
+
+    def __init__(self, embeddings: Embeddings, model_id: str, cache: Optional[EmbeddingCache] = None):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.cache = cache or get_embedding_cache()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, only calling the model for texts not in the cache"""
+        hashes = [text_hash(text) for text in texts]
+        cached = self.cache.get_many(self.model_id, list(set(hashes)))
+
+        missing = {}
+        for text, key in zip(texts, hashes):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_id, computed)
+            cached.update(computed)
+
+        logger.info(f"Embedded {len(texts)} documents with {self.model_id}: {len(texts) - len(missing)} from cache, {len(missing)} computed")
+        return [cached[key] for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a search query with the underlying model"""
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several search queries in one model call, bypassing the disk cache"""
+        if len(texts) == 1:
+            return [self.embed_query(texts[0])]
+        return self.embeddings.embed_documents(texts)
@@ -0,0 +1,255 @@
+"""
+CKD Factor Passages Module
+
+This module precomputes the top guideline passages for every risk factor
+covered by the questionnaire, so that the research context for a patient
+can be assembled without any embedding or search calls at assessment time.
+
+Features:
+- Fixed search queries per questionnaire risk factor
+- Build step that runs every factor query once against the knowledge base
+  and stores the passages per provider
+- Lookup of stored passages by factor, reloaded when the file changes
+- Research context for a patient's positive factors, with passages shared
+  between factors listed once and the whole context kept to a token budget
+
+Usage:
+    python factor_passages.py --provider groq
+    python factor_passages.py --provider openai --k 4
+"""
+
+import os
+import json
+import argparse
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from knowledge_base import (
+    retrieve_documents_batch, get_embedding_model_id, get_manifest_fingerprint,
+    DUPLICATE_CANDIDATE_MULTIPLIER, DEFAULT_RETRIEVAL_MODE
+)
+from retrieval_postprocess import suppress_near_duplicates, compact_source_label, fit_to_token_budget
+from patient_parser import match_question_field, parse_answer, parse_yes_no
+
+logger = logging.getLogger(__name__)
+
+FACTOR_PASSAGES_DIR = os.getenv("CKD_FACTOR_PASSAGES_DIR", "./factor_passages")
+FACTOR_PASSAGES_VERSION = 1
+FACTOR_PASSAGES_K = 3
+FACTOR_CONTEXT_TOKEN_BUDGET = int(os.getenv("CKD_FACTOR_CONTEXT_TOKEN_BUDGET", "2500"))
+
+# Questionnaire risk factors by models.PatientData field name, with a
+# display name and the guideline search query
+RISK_FACTORS: Dict[str, Dict[str, str]] = {
+    "hypertension": {"name": "Hypertension",
+                     "query": "hypertension blood pressure control as a risk factor for CKD"},
+    "diabetes_type_1": {"name": "Type 1 diabetes",
+                        "query": "type 1 diabetes kidney disease screening albuminuria"},
+    "diabetes_type_2": {"name": "Type 2 diabetes",
+                        "query": "type 2 diabetes CKD risk SGLT2 inhibitors"},
+    "cardiovascular_disease": {"name": "Cardiovascular disease",
+                               "query": "cardiovascular disease and chronic kidney disease risk"},
+    "appetite_changes": {"name": "Appetite changes",
+                         "query": "loss of appetite anorexia in chronic kidney disease"},
+    "pedal_edema": {"name": "Pedal edema",
+                    "query": "edema fluid overload in kidney disease"},
+    "hematuria": {"name": "Hematuria",
+                  "query": "hematuria evaluation in CKD"},
+    "nocturia": {"name": "Nocturia",
+                 "query": "nocturia and urine concentrating ability in kidney disease"},
+    "flank_discomfort": {"name": "Flank discomfort",
+                         "query": "flank pain kidney structural abnormalities"},
+    "decreased_urine_output": {"name": "Decreased urine output",
+                               "query": "reduced urine output oliguria kidney function decline"},
+    "fatigue": {"name": "Fatigue",
+                "query": "fatigue and anemia in chronic kidney disease"},
+    "nausea_vomiting": {"name": "Nausea or vomiting",
+                        "query": "nausea vomiting uremic symptoms advanced CKD"},
+    "metallic_taste": {"name": "Metallic taste",
+                       "query": "metallic taste uremia kidney failure symptoms"},
+    "unintended_weight_loss": {"name": "Unintended weight loss",
+                               "query": "unintentional weight loss malnutrition in CKD"},
+    "itching": {"name": "Itching",
+                "query": "pruritus itching in chronic kidney disease"},
+    "mental_state_changes": {"name": "Mental state changes",
+                             "query": "confusion cognitive impairment uremic encephalopathy CKD"},
+    "breathing_difficulty": {"name": "Breathing difficulty",
+                             "query": "shortness of breath fluid overload kidney disease"}
+}
+
+_passages_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_passages_lock = threading.Lock()
+
+def get_factor_passages_path(provider: str) -> str:
+    """Return the file holding the precomputed passages of a provider"""
+    return os.path.join(FACTOR_PASSAGES_DIR, f"{provider}.json")
+
+def build_factor_passages(provider: str, k: int = FACTOR_PASSAGES_K, mode: Optional[str] = None) -> Dict[str, Any]:
+    """Retrieve the top passages of every risk factor and store them for a provider
+
+    All factor queries run as one batched search.
+
+    Returns:
+        The stored passage index
+    """
+    factors = list(RISK_FACTORS)
+    queries = [RISK_FACTORS[factor]["query"] for factor in factors]
+    results = retrieve_documents_batch(queries, provider, k * DUPLICATE_CANDIDATE_MULTIPLIER, mode)
+
+    index = {
+        "version": FACTOR_PASSAGES_VERSION,
+        "provider": provider,
+        "embedding_model": get_embedding_model_id(provider),
+        "manifest_sha256": get_manifest_fingerprint(provider),
+        "mode": mode or DEFAULT_RETRIEVAL_MODE,
+        "k": k,
+        "built_at": datetime.now().isoformat(),
+        "factors": {}
+    }
+    for factor, documents in zip(factors, results):
+        index["factors"][factor] = [
+            {
+                "chunk_id": doc.metadata.get("chunk_id"),
+                "source": compact_source_label(doc.metadata),
+                "text": doc.page_content.strip()
+            }
+            for doc in suppress_near_duplicates(documents, k)
+        ]
+
+    path = get_factor_passages_path(provider)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, path)
+
+    logger.info(f"Stored passages for {len(factors)} risk factors of {provider} in {path}")
+    return index
+
+def load_factor_passages(provider: str) -> Optional[Dict[str, Any]]:
+    """Return the stored passage index of a provider, or None if it was never built"""
+    path = get_factor_passages_path(provider)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _passages_lock:
+        cached = _passages_cache.get(provider)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable factor passages {path}: {str(e)}")
+            return None
+        if index.get("version") != FACTOR_PASSAGES_VERSION:
+            logger.warning(f"Ignoring factor passages {path} with unsupported version {index.get('version')}")
+            return None
+        if index.get("manifest_sha256") != get_manifest_fingerprint(provider):
+            logger.warning(f"Factor passages for {provider} were built from an older knowledge base - rebuild with factor_passages.py")
+        _passages_cache[provider] = (mtime, index)
+        return index
+
+def get_factor_passages(factor: str, provider: str) -> List[Dict[str, str]]:
+    """Return the precomputed passages of a risk factor, or [] if none are stored"""
+    if factor not in RISK_FACTORS:
+        raise ValueError(f"Unknown risk factor: {factor}. Use one of {', '.join(RISK_FACTORS)}")
+    index = load_factor_passages(provider)
+    if index is None:
+        return []
+    return index["factors"].get(factor, [])
+
+def match_factor(question: str) -> Optional[str]:
+    """Return the risk factor a questionnaire question asks about, if any"""
+    field = match_question_field(question)
+    return field if field in RISK_FACTORS else None
+
+def is_positive_answer(factor: str, answer: Any) -> bool:
+    """Whether an answer reports a risk factor as present or possibly present"""
+    value, parsed, _ = parse_answer(factor, answer)
+    if not parsed:
+        # e.g. a plain "yes" to the appetite question, whose choices are directions
+        return parse_yes_no(str(answer))[0] is True
+    return value is True or (isinstance(value, str) and value not in ("unchanged", "none"))
+
+def identify_positive_factors(qna_responses: List[Dict[str, Any]]) -> List[str]:
+    """Return the risk factors a patient answered yes or maybe to, in questionnaire order"""
+    positive = []
+    for response in qna_responses:
+        factor = match_factor(response.get("question", ""))
+        if factor and factor not in positive and is_positive_answer(factor, response.get("answer", "")):
+            positive.append(factor)
+    return positive
+
+def build_research_context(qna_responses: List[Dict[str, Any]], provider: str,
+                           token_budget: int = FACTOR_CONTEXT_TOKEN_BUDGET) -> Optional[str]:
+    """Assemble guideline passages for a patient's positive risk factors
+
+    Returns:
+        Formatted passages grouped by factor, or None if no passages have
+        been built for the provider
+    """
+    index = load_factor_passages(provider)
+    if index is None:
+        return None
+
+    factors = identify_positive_factors(qna_responses)
+    if not factors:
+        return "No risk factors were reported as present."
+
+    labels: Dict[str, str] = {}
+    sections = []
+    for factor in factors:
+        shared = []
+        passages = []
+        for passage in index["factors"].get(factor, []):
+            key = passage.get("chunk_id") or passage["text"]
+            if key in labels:
+                shared.append(labels[key])
+                continue
+            labels[key] = f"P{len(labels) + 1}"
+            passages.append(f"[{labels[key]}] ({passage['source']}): {passage['text']}")
+        heading = f"### {RISK_FACTORS[factor]['name']}"
+        if shared:
+            heading += f" (see also {', '.join(shared)})"
+        sections.append("\n".join([heading] + passages))
+
+    return "\n\n".join(fit_to_token_budget(sections, token_budget))
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="CKD Risk Factor Passage Builder")
+
+    parser.add_argument('--provider', choices=['groq', 'openai'],
+                       default='groq', help='Provider whose knowledge base to search')
+    parser.add_argument('--k', type=int, default=FACTOR_PASSAGES_K,
+                       help='Number of passages stored per risk factor')
+    parser.add_argument('--mode', choices=['vector', 'lexical', 'hybrid'], default=DEFAULT_RETRIEVAL_MODE,
+                       help='Retrieval mode used to select the passages')
+
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    try:
+        index = build_factor_passages(args.provider, args.k, args.mode)
+        for factor, passages in index["factors"].items():
+            logger.info(f"{factor}: {', '.join(passage['source'] for passage in passages) or 'no passages'}")
+        return 0
+    except Exception as e:
+        logger.error(f"Building factor passages failed: {e}")
+        return 1
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,776 @@
+"""
+CKD Knowledge Base Module
+
+This module owns the per-provider vector stores that back the
+search_medical_knowledge tool.
+
+Features:
+- One embedding model and one Chroma handle per provider per process
+- Thread-safe lazy opening shared by the Streamlit app and the CLI scripts
+- Explicit invalidation when the underlying store needs to be reopened
+- Incremental ingestion of ./data driven by a content-hashed manifest
+- Parallel parsing and splitting of source files in a process pool, done
+  once into the shared chunk store and reused by every provider
+- Document embeddings served from the persistent embedding cache
+- LRU/TTL caches of query embeddings and formatted search results that are
+  invalidated automatically whenever the index changes
+- BM25 lexical index built alongside each vector store, with vector, lexical
+  and hybrid (reciprocal rank fusion) retrieval modes selectable per call
+- Optional Chroma-free search backend over an exported, memory-mapped NumPy index
+- Batched multi-query search with one embedding pass, one vectorized index
+  lookup and de-duplicated, grouped results
+- Search output with near-duplicate chunks suppressed, compact source labels
+  and a token budget
+
+The registry lives in this module rather than in main.py because Streamlit
+re-executes the main script on every rerun, while imported modules stay
+loaded for the lifetime of the server process.
+
+Usage:
+    python knowledge_base.py --provider groq
+    python knowledge_base.py --provider groq --export-numpy --numpy-dtype int8
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import logging
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from langchain_openai import OpenAIEmbeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain.vectorstores import Chroma
+from langchain.document_loaders import TextLoader
+from langchain_community.document_loaders import PyPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+
+from embedding_cache import CachedEmbeddings
+from chunk_store import chunk_hash, get_chunk_store
+from query_cache import LRUCache, normalize_query
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from numpy_index import NumpyIndex, export_numpy_index, get_numpy_index_path
+from retrieval_postprocess import (
+    suppress_near_duplicates, find_near_duplicate, compact_source_label, fit_to_token_budget, count_tokens,
+    RETRIEVAL_TOKEN_BUDGET, BATCH_RETRIEVAL_TOKEN_BUDGET
+)
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = "./data"
+EMBEDDING_MODELS = {
+    "openai": "text-embedding-ada-002",
+    "groq": "sentence-transformers/all-MiniLM-L6-v2"
+}
+SOURCE_PATTERNS = ["**/*.pdf", "**/*.txt"]
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+MANIFEST_FILENAME = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+ADD_BATCH_SIZE = 256
+SEARCH_RESULTS_K = 5
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+DEFAULT_RETRIEVAL_MODE = os.getenv("CKD_RETRIEVAL_MODE", "hybrid")
+HYBRID_CANDIDATE_MULTIPLIER = 4
+DUPLICATE_CANDIDATE_MULTIPLIER = 2
+VECTOR_BACKENDS = ("chroma", "numpy")
+VECTOR_BACKEND = os.getenv("CKD_VECTOR_BACKEND", "chroma")
+NUMPY_INDEX_DTYPE = os.getenv("CKD_NUMPY_INDEX_DTYPE", "float32")
+NUMPY_INDEX_RESCORE = os.getenv("CKD_NUMPY_INDEX_RESCORE", "true").lower() in ("1", "true", "yes")
+NO_RESULTS_MESSAGE = "No relevant medical information found for this query."
+INGEST_WORKERS = int(os.getenv("CKD_INGEST_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Process-wide registries keyed by provider
+_registry_lock = threading.Lock()
+_chunk_store_lock = threading.Lock()
+_provider_locks: Dict[str, threading.RLock] = {}
+_embeddings_registry: Dict[str, object] = {}
+_vector_store_registry: Dict[str, Chroma] = {}
+_index_generations: Dict[str, int] = {}
+_lexical_index_registry: Dict[str, Tuple[int, BM25Index]] = {}
+_numpy_index_registry: Dict[str, NumpyIndex] = {}
+
+# Search caches; result keys carry the index generation they were computed for
+_query_embedding_cache = LRUCache()
+_search_result_cache = LRUCache()
+
+def _get_provider_lock(provider: str) -> threading.RLock:
+    """Return the lock guarding the registry entries of a provider"""
+    with _registry_lock:
+        if provider not in _provider_locks:
+            _provider_locks[provider] = threading.RLock()
+        return _provider_locks[provider]
+
+def get_index_generation(provider: str) -> int:
+    """Return a counter that changes every time a provider's index changes"""
+    return _index_generations.get(provider, 0)
+
+def _bump_index_generation(provider: str) -> None:
+    """Mark a provider's index as changed and drop its cached search results"""
+    with _registry_lock:
+        _index_generations[provider] = _index_generations.get(provider, 0) + 1
+    removed = _search_result_cache.invalidate(lambda key: key[0] == provider)
+    logger.info(f"Index generation for {provider} is now {_index_generations[provider]}; dropped {removed} cached search results")
+
+def get_vector_store_path(provider: str) -> str:
+    """Return the persist directory of the vector store for a provider"""
+    return f"./chroma_db_{provider}"
+
+def get_embedding_model_id(provider: str) -> str:
+    """Return the embedding model used for a provider's vector store"""
+    return EMBEDDING_MODELS["openai" if provider == "openai" else "groq"]
+
+# Get embeddings based on LLM provider
+def _create_embeddings(provider):
+    model_id = get_embedding_model_id(provider)
+    if provider == "openai":
+        embeddings = OpenAIEmbeddings(model=model_id, api_key=os.getenv("OPENAI_API_KEY"))
+    else:  # groq models
+        embeddings = HuggingFaceEmbeddings(model_name=model_id)
+    return CachedEmbeddings(embeddings, model_id)
+
+def get_embeddings(provider):
+    """Return the shared embedding model for a provider, loading it on first use"""
+    lock = _get_provider_lock(provider)
+    with lock:
+        embeddings = _embeddings_registry.get(provider)
+        if embeddings is None:
+            logger.info(f"Loading embedding model for provider: {provider}")
+            embeddings = _create_embeddings(provider)
+            _embeddings_registry[provider] = embeddings
+        return embeddings
+
+def _hash_file(path: str) -> str:
+    """Return the SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def list_source_files(data_dir: str = DATA_DIR) -> List[str]:
+    """List ingestible files using the same path form as the document loaders"""
+    files = set()
+    for pattern in SOURCE_PATTERNS:
+        for path in Path(data_dir).glob(pattern):
+            if path.is_file():
+                files.add(str(path))
+    return sorted(files)
+
+def load_source_file(path: str) -> List[Document]:
+    """Load a single source file into one document per page"""
+    loader = PyPDFLoader(path) if path.lower().endswith(".pdf") else TextLoader(path)
+    return loader.load()
+
+def _load_and_split(path: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[Any]:
+    """Load a single source file and split it into chunks"""
+    documents = load_source_file(path)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return text_splitter.split_documents(documents)
+
+def _parse_file(path: str, chunk_size: int, chunk_overlap: int) -> Tuple[str, List[Document], float]:
+    """Parse and split one file; runs inside a worker process"""
+    start_time = time.perf_counter()
+    chunks = _load_and_split(path, chunk_size, chunk_overlap)
+    return path, chunks, time.perf_counter() - start_time
+
+def iter_parsed_files(paths: List[str], workers: Optional[int] = None):
+    """Parse and split files in parallel, yielding each file as soon as it is ready
+
+    Yields:
+        Tuples of (path, chunks, parse_seconds) in completion order
+    """
+    workers = max(1, min(workers or INGEST_WORKERS, len(paths)))
+    if workers == 1:
+        for path in paths:
+            yield _parse_file(path, CHUNK_SIZE, CHUNK_OVERLAP)
+        return
+
+    # Spawn rather than fork: the Streamlit server is multi-threaded
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = {executor.submit(_parse_file, path, CHUNK_SIZE, CHUNK_OVERLAP): path for path in paths}
+        for future in as_completed(futures):
+            yield future.result()
+
+def sync_chunk_store(workers: Optional[int] = None) -> Dict[str, Any]:
+    """Bring the shared chunk store in line with the files currently in ./data
+
+    Only files whose content or chunking parameters changed are parsed;
+    every provider then embeds from the stored chunks.
+
+    Returns:
+        Report with the number of files parsed, removed and unchanged, and
+        the parse time of every parsed file
+    """
+    store = get_chunk_store()
+    report = {"files_parsed": 0, "files_removed": 0, "files_unchanged": 0, "parse_seconds": {}}
+    with _chunk_store_lock:
+        stored_files = store.list_files()
+        current_files = list_source_files()
+        for source in set(stored_files) - set(current_files):
+            store.remove_file(source)
+            report["files_removed"] += 1
+
+        changed_files = {}
+        for source in current_files:
+            file_hash = _hash_file(source)
+            stored = stored_files.get(source)
+            if stored and (stored["sha256"], stored["chunk_size"], stored["chunk_overlap"]) == (file_hash, CHUNK_SIZE, CHUNK_OVERLAP):
+                report["files_unchanged"] += 1
+            else:
+                changed_files[source] = file_hash
+
+        for source, chunks, parse_seconds in iter_parsed_files(list(changed_files), workers):
+            chunk_ids = store.replace_file(source, changed_files[source], CHUNK_SIZE, CHUNK_OVERLAP, chunks)
+            report["parse_seconds"][source] = round(parse_seconds, 3)
+            report["files_parsed"] += 1
+            logger.info(f"Parsed {source} into the chunk store in {parse_seconds:.2f}s: {len(chunk_ids)} chunks")
+
+    if report["files_parsed"] or report["files_removed"]:
+        logger.info(f"Chunk store sync: {report}")
+    return report
+
+def _manifest_path(provider: str) -> str:
+    return os.path.join(get_vector_store_path(provider), MANIFEST_FILENAME)
+
+def _new_manifest() -> Dict[str, Any]:
+    return {
+        "version": MANIFEST_VERSION,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "files": {}
+    }
+
+def _load_manifest(provider: str) -> Optional[Dict[str, Any]]:
+    """Load the ingestion manifest of a provider, or None if there is none"""
+    path = _manifest_path(provider)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable ingestion manifest {path}: {str(e)}")
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        logger.warning(f"Ignoring ingestion manifest {path} with unsupported version {manifest.get('version')}")
+        return None
+    return manifest
+
+def _save_manifest(provider: str, manifest: Dict[str, Any]) -> None:
+    """Atomically write the ingestion manifest of a provider"""
+    path = _manifest_path(provider)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+def _adopt_existing_store(vector_store: Chroma) -> Tuple[Dict[str, Any], List[str]]:
+    """Build a manifest for a store created before manifests existed
+
+    Existing chunks are matched by content, so a store built by an older
+    version of the app is reused without re-embedding anything that did
+    not change. File hashes are left empty, which makes the next sync
+    re-split every file and only embed chunks whose content is new.
+    Returns the manifest and the ids of duplicated chunks to delete.
+    """
+    manifest = _new_manifest()
+    duplicate_ids = []
+    existing = vector_store.get(include=["metadatas", "documents"])
+    for chunk_id, metadata, text in zip(existing["ids"], existing["metadatas"], existing["documents"]):
+        metadata = metadata or {}
+        source = os.path.normpath(metadata.get("source", "unknown"))
+        key = chunk_hash(source, metadata.get("page"), text or "")
+        entry = manifest["files"].setdefault(source, {"sha256": None, "chunks": {}})
+        if key in entry["chunks"]:
+            duplicate_ids.append(chunk_id)
+        else:
+            entry["chunks"][key] = chunk_id
+    logger.info(f"Adopted {len(existing['ids'])} existing chunks from {len(manifest['files'])} sources into a new manifest")
+    return manifest, duplicate_ids
+
+def _add_chunks(vector_store: Chroma, chunks: List[Any], ids: List[str]) -> None:
+    """Embed and add chunks to the vector store in bounded batches"""
+    for start in range(0, len(chunks), ADD_BATCH_SIZE):
+        batch = chunks[start:start + ADD_BATCH_SIZE]
+        vector_store.add_texts(
+            texts=[chunk.page_content for chunk in batch],
+            metadatas=[chunk.metadata for chunk in batch],
+            ids=ids[start:start + ADD_BATCH_SIZE]
+        )
+
+def sync_vector_store(vector_store: Chroma, provider: str) -> Dict[str, Any]:
+    """Bring a vector store in line with the files currently in ./data
+
+    Source files are parsed into the shared chunk store first, and only if
+    they changed since any provider last parsed them. The vector store then
+    embeds only chunks whose content is new, and chunks of changed or
+    deleted files that no longer exist are removed.
+
+    Returns:
+        Report with the number of files and chunks added, removed and kept,
+        and the parse time of every re-parsed file
+    """
+    chunk_report = sync_chunk_store()
+    store = get_chunk_store()
+
+    manifest = _load_manifest(provider)
+    stale_ids = []
+    if manifest is None:
+        if vector_store.get(limit=1)["ids"]:
+            manifest, stale_ids = _adopt_existing_store(vector_store)
+        else:
+            manifest = _new_manifest()
+    elif (manifest.get("chunk_size"), manifest.get("chunk_overlap")) != (CHUNK_SIZE, CHUNK_OVERLAP):
+        # Chunk boundaries moved, so every file has to be re-diffed
+        logger.info("Chunking parameters changed since last ingestion - re-diffing all files")
+        for entry in manifest["files"].values():
+            entry["sha256"] = None
+        manifest["chunk_size"], manifest["chunk_overlap"] = CHUNK_SIZE, CHUNK_OVERLAP
+
+    report = {"files_changed": 0, "files_removed": 0, "files_unchanged": 0,
+              "chunks_added": 0, "chunks_removed": 0, "chunks_kept": 0,
+              "parse_seconds": chunk_report["parse_seconds"]}
+
+    stored_files = store.list_files()
+    for source in set(manifest["files"]) - set(stored_files):
+        entry = manifest["files"].pop(source)
+        stale_ids.extend(entry["chunks"].values())
+        report["files_removed"] += 1
+        logger.info(f"Source removed from data directory: {source}")
+
+    for source, stored in stored_files.items():
+        entry = manifest["files"].get(source)
+        if entry and entry["sha256"] == stored["sha256"]:
+            report["files_unchanged"] += 1
+            report["chunks_kept"] += len(entry["chunks"])
+            continue
+
+        old_chunks = entry["chunks"] if entry else {}
+        new_chunks = {}
+        to_add, to_add_ids = [], []
+        for chunk in store.get_chunks(source):
+            key = chunk.metadata["chunk_id"]
+            if key in old_chunks:
+                new_chunks[key] = old_chunks[key]
+            else:
+                new_chunks[key] = key
+                to_add.append(chunk)
+                to_add_ids.append(key)
+
+        removed = [chunk_id for key, chunk_id in old_chunks.items() if key not in new_chunks]
+        stale_ids.extend(removed)
+        if to_add:
+            _add_chunks(vector_store, to_add, to_add_ids)
+
+        manifest["files"][source] = {"sha256": stored["sha256"], "chunks": new_chunks}
+        report["files_changed"] += 1
+        report["chunks_added"] += len(to_add)
+        report["chunks_kept"] += len(new_chunks) - len(to_add)
+        logger.info(f"Indexed {source} for {provider}: {len(to_add)} new chunks, {len(removed)} removed, {len(new_chunks) - len(to_add)} unchanged")
+
+    if stale_ids:
+        vector_store.delete(ids=stale_ids)
+    report["chunks_removed"] = len(stale_ids)
+
+    if report["chunks_added"] or stale_ids:
+        vector_store.persist()
+        _bump_index_generation(provider)
+    _save_manifest(provider, manifest)
+    logger.info(f"Vector store sync for {provider}: {report}")
+    return report
+
+def _open_vector_store(provider: str, embeddings) -> Chroma:
+    """Open the persisted vector store for a provider and sync it with ./data"""
+    db_path = get_vector_store_path(provider)
+    vector_store = Chroma(persist_directory=db_path, embedding_function=embeddings)
+    sync_vector_store(vector_store, provider)
+    return vector_store
+
+def initialize_vector_store(provider="openai"):
+    """Return the shared vector store for a provider, opening it once per process"""
+    vector_store = _vector_store_registry.get(provider)
+    if vector_store is not None:
+        return vector_store
+
+    embeddings = get_embeddings(provider)
+    lock = _get_provider_lock(provider)
+    with lock:
+        # Another thread may have opened the store while we were waiting
+        vector_store = _vector_store_registry.get(provider)
+        if vector_store is None:
+            logger.info(f"Opening vector store for provider: {provider}")
+            vector_store = _open_vector_store(provider, embeddings)
+            if VECTOR_BACKEND == "chroma":
+                _lexical_index_registry[provider] = (get_index_generation(provider), _build_lexical_index(get_chunk_store().get_chunks()))
+            _vector_store_registry[provider] = vector_store
+        return vector_store
+
+def invalidate_vector_store(provider: Optional[str] = None, include_embeddings: bool = False) -> None:
+    """Drop cached vector store handles so the next search reopens them
+
+    Args:
+        provider: Provider to invalidate, or None for every provider
+        include_embeddings: Also drop the loaded embedding models
+    """
+    providers = [provider] if provider else list(_vector_store_registry.keys() | _embeddings_registry.keys())
+    for name in providers:
+        with _get_provider_lock(name):
+            _vector_store_registry.pop(name, None)
+            _lexical_index_registry.pop(name, None)
+            _numpy_index_registry.pop(name, None)
+            if include_embeddings:
+                _embeddings_registry.pop(name, None)
+        _bump_index_generation(name)
+        if include_embeddings:
+            model_id = get_embedding_model_id(name)
+            _query_embedding_cache.invalidate(lambda key: key[0] == model_id)
+        logger.info(f"Invalidated cached vector store for provider: {name}")
+
+def embed_search_query(query: str, provider: str) -> List[float]:
+    """Return the embedding of a search query, reusing cached embeddings"""
+    key = (get_embedding_model_id(provider), normalize_query(query))
+    embedding = _query_embedding_cache.get(key)
+    if embedding is None:
+        embedding = get_embeddings(provider).embed_query(query)
+        _query_embedding_cache.put(key, embedding)
+    return embedding
+
+def get_manifest_fingerprint(provider: str) -> Optional[str]:
+    """Return the SHA-256 of a provider's ingestion manifest, if there is one"""
+    path = _manifest_path(provider)
+    return _hash_file(path) if os.path.exists(path) else None
+
+def export_vector_store_to_numpy(provider: str, dtype: Optional[str] = None) -> Dict[str, Any]:
+    """Export a provider's vector store into the memory-mapped NumPy index"""
+    vector_store = initialize_vector_store(provider)
+    with _get_provider_lock(provider):
+        info = export_numpy_index(
+            vector_store,
+            get_numpy_index_path(provider),
+            dtype=dtype or NUMPY_INDEX_DTYPE,
+            info={
+                "provider": provider,
+                "embedding_model": get_embedding_model_id(provider),
+                "manifest_sha256": get_manifest_fingerprint(provider)
+            }
+        )
+        _numpy_index_registry.pop(provider, None)
+    return info
+
+def get_numpy_index(provider: str) -> NumpyIndex:
+    """Return the NumPy index of a provider, exporting it from Chroma if missing or stale"""
+    index = _numpy_index_registry.get(provider)
+    if index is not None:
+        return index
+
+    with _get_provider_lock(provider):
+        index = _numpy_index_registry.get(provider)
+        if index is not None:
+            return index
+
+        index_dir = get_numpy_index_path(provider)
+        if not os.path.exists(os.path.join(index_dir, "chunks.json")):
+            logger.info(f"No NumPy index for {provider} - exporting from the vector store")
+            export_vector_store_to_numpy(provider)
+        index = NumpyIndex(index_dir, rescore=NUMPY_INDEX_RESCORE)
+
+        manifest_sha = get_manifest_fingerprint(provider)
+        stale_manifest = manifest_sha is not None and index.info.get("manifest_sha256") != manifest_sha
+        if stale_manifest or index.info.get("embedding_model") != get_embedding_model_id(provider):
+            logger.info(f"NumPy index for {provider} is out of date - re-exporting from the vector store")
+            export_vector_store_to_numpy(provider, dtype=index.info.get("dtype"))
+            index = NumpyIndex(index_dir, rescore=NUMPY_INDEX_RESCORE)
+
+        logger.info(f"Opened NumPy index for {provider}: {len(index)} chunks ({index.info.get('dtype')})")
+        _numpy_index_registry[provider] = index
+        _bump_index_generation(provider)
+        return index
+
+def get_search_index(provider: str):
+    """Return the dense index configured by CKD_VECTOR_BACKEND for a provider"""
+    if VECTOR_BACKEND not in VECTOR_BACKENDS:
+        raise ValueError(f"Unsupported vector backend: {VECTOR_BACKEND}. Use one of {', '.join(VECTOR_BACKENDS)}")
+    if VECTOR_BACKEND == "numpy":
+        return get_numpy_index(provider)
+    return initialize_vector_store(provider)
+
+def _build_lexical_index(documents: List[Document]) -> BM25Index:
+    """Build a BM25 index over a list of chunks"""
+    start_time = time.perf_counter()
+    index = BM25Index(documents, [doc.page_content for doc in documents])
+    logger.info(f"Built lexical index over {len(index)} chunks in {time.perf_counter() - start_time:.2f}s")
+    return index
+
+def get_lexical_index(provider: str) -> BM25Index:
+    """Return the BM25 index of a provider, rebuilding it if the dense index changed"""
+    search_index = get_search_index(provider)
+    entry = _lexical_index_registry.get(provider)
+    if entry is None or entry[0] != get_index_generation(provider):
+        with _get_provider_lock(provider):
+            entry = _lexical_index_registry.get(provider)
+            generation = get_index_generation(provider)
+            if entry is None or entry[0] != generation:
+                if isinstance(search_index, NumpyIndex):
+                    documents = search_index.documents
+                else:
+                    # Chroma stores are synced with the chunk store, which avoids reading every text back
+                    documents = get_chunk_store().get_chunks()
+                entry = (generation, _build_lexical_index(documents))
+                _lexical_index_registry[provider] = entry
+    return entry[1]
+
+def embed_search_queries(queries: List[str], provider: str) -> List[List[float]]:
+    """Embed many search queries, sending every cache miss to the model in one batch"""
+    model_id = get_embedding_model_id(provider)
+    keys = [(model_id, normalize_query(query)) for query in queries]
+    embeddings = {key: _query_embedding_cache.get(key) for key in set(keys)}
+
+    missing = {}
+    for key, query in zip(keys, queries):
+        if embeddings[key] is None and key not in missing:
+            missing[key] = query
+    if missing:
+        vectors = get_embeddings(provider).embed_queries(list(missing.values()))
+        for key, vector in zip(missing.keys(), vectors):
+            _query_embedding_cache.put(key, vector)
+            embeddings[key] = vector
+    return [embeddings[key] for key in keys]
+
+def _dense_search_batch(search_index, query_embeddings: List[List[float]], k: int) -> List[List[Document]]:
+    """Run every dense top-k lookup of a batch in a single index call"""
+    if isinstance(search_index, NumpyIndex):
+        return [
+            [search_index.documents[row] for row, _ in rows]
+            for rows in search_index.batch_search_by_vectors(query_embeddings, k)
+        ]
+
+    result = search_index._collection.query(
+        query_embeddings=query_embeddings, n_results=k, include=["documents", "metadatas"]
+    )
+    return [
+        [Document(page_content=text or "", metadata=metadata or {}) for text, metadata in zip(texts, metadatas)]
+        for texts, metadatas in zip(result["documents"], result["metadatas"])
+    ]
+
+def _document_key(doc: Document) -> str:
+    """Identify a chunk across retrieval backends"""
+    return doc.metadata.get("chunk_id") or chunk_hash(
+        os.path.normpath(doc.metadata.get("source", "unknown")), doc.metadata.get("page"), doc.page_content
+    )
+
+def retrieve_documents(query: str, provider: str, k: int = SEARCH_RESULTS_K, mode: Optional[str] = None) -> List[Document]:
+    """Return the k chunks most relevant to a query
+
+    Args:
+        query: Search query
+        provider: Provider whose knowledge base to search
+        k: Number of chunks to return
+        mode: "vector" for dense similarity, "lexical" for BM25, or "hybrid"
+            to fuse both rankings with reciprocal rank fusion
+    """
+    mode = mode or DEFAULT_RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unsupported retrieval mode: {mode}. Use one of {', '.join(RETRIEVAL_MODES)}")
+
+    if mode == "lexical":
+        return [doc for doc, _ in get_lexical_index(provider).search(query, k)]
+
+    search_index = get_search_index(provider)
+    embedding = embed_search_query(query, provider)
+    if mode == "vector":
+        return search_index.similarity_search_by_vector(embedding, k=k)
+
+    candidates = k * HYBRID_CANDIDATE_MULTIPLIER
+    dense = search_index.similarity_search_by_vector(embedding, k=candidates)
+    lexical = get_lexical_index(provider).search(query, candidates)
+    return reciprocal_rank_fusion([
+        [(_document_key(doc), doc) for doc in dense],
+        [(_document_key(doc), doc) for doc, _ in lexical]
+    ], k)
+
+def retrieve_documents_batch(queries: List[str], provider: str, k: int = SEARCH_RESULTS_K, mode: Optional[str] = None) -> List[List[Document]]:
+    """Return the k most relevant chunks for each of several queries
+
+    All queries are embedded in one batch and looked up in one vectorized
+    index call; lexical ranking and fusion then run per query in memory.
+    """
+    mode = mode or DEFAULT_RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unsupported retrieval mode: {mode}. Use one of {', '.join(RETRIEVAL_MODES)}")
+    if not queries:
+        return []
+
+    if mode == "lexical":
+        lexical_index = get_lexical_index(provider)
+        return [[doc for doc, _ in lexical_index.search(query, k)] for query in queries]
+
+    search_index = get_search_index(provider)
+    query_embeddings = embed_search_queries(queries, provider)
+    if mode == "vector":
+        return _dense_search_batch(search_index, query_embeddings, k)
+
+    candidates = k * HYBRID_CANDIDATE_MULTIPLIER
+    dense_results = _dense_search_batch(search_index, query_embeddings, candidates)
+    lexical_index = get_lexical_index(provider)
+    return [
+        reciprocal_rank_fusion([
+            [(_document_key(doc), doc) for doc in dense],
+            [(_document_key(doc), doc) for doc, _ in lexical_index.search(query, candidates)]
+        ], k)
+        for query, dense in zip(queries, dense_results)
+    ]
+
+def format_search_results(documents: List[Document], token_budget: int = RETRIEVAL_TOKEN_BUDGET) -> str:
+    """Format retrieved chunks with compact source labels within a token budget"""
+    formatted_results = []
+    for i, doc in enumerate(documents, 1):
+        source = compact_source_label(doc.metadata)
+        content = doc.page_content.strip()
+        formatted_results.append(f"Source {i} ({source}):\n{content}")
+
+    return "\n\n" + "="*50 + "\n\n".join(fit_to_token_budget(formatted_results, token_budget))
+
+def search_knowledge(query: str, provider: str, k: int = SEARCH_RESULTS_K, mode: Optional[str] = None) -> str:
+    """Search the knowledge base and return formatted results, using the result cache"""
+    mode = mode or DEFAULT_RETRIEVAL_MODE
+    key = (provider, get_index_generation(provider), normalize_query(query), k, mode)
+    cached = _search_result_cache.get(key)
+    if cached is not None:
+        logger.info(f"Search result cache hit for query: {query}")
+        return cached
+
+    # Over-fetch so that k distinct chunks remain after near-duplicate suppression
+    documents = retrieve_documents(query, provider, k * DUPLICATE_CANDIDATE_MULTIPLIER, mode)
+    documents = suppress_near_duplicates(documents, k)
+    if not documents:
+        logger.warning(f"No results found for query: {query}")
+        return NO_RESULTS_MESSAGE
+
+    formatted = format_search_results(documents)
+    _search_result_cache.put(key, formatted)
+    logger.info(f"Found {len(documents)} relevant documents for query: {query}")
+    return formatted
+
+def format_batch_search_results(queries: List[str], results: List[List[Document]],
+                                token_budget: int = BATCH_RETRIEVAL_TOKEN_BUDGET) -> str:
+    """Format grouped results of a batch search, printing each shared chunk once
+
+    Chunks are labelled in rank order across queries (every query's best
+    chunk first), so trimming to the token budget drops the lowest-ranked
+    passages rather than whole queries. Near-duplicates of an already
+    labelled chunk share its label.
+    """
+    labels: Dict[str, str] = {}
+    unique_documents: List[Document] = []
+    query_labels: List[List[str]] = [[] for _ in queries]
+    for rank in range(max((len(documents) for documents in results), default=0)):
+        for i, documents in enumerate(results):
+            if rank >= len(documents):
+                continue
+            doc = documents[rank]
+            key = _document_key(doc)
+            if key not in labels:
+                duplicate = find_near_duplicate(doc.page_content, [kept.page_content for kept in unique_documents])
+                if duplicate is not None:
+                    labels[key] = labels[_document_key(unique_documents[duplicate])]
+                else:
+                    labels[key] = f"S{len(unique_documents) + 1}"
+                    unique_documents.append(doc)
+            if labels[key] not in query_labels[i]:
+                query_labels[i].append(labels[key])
+
+    sections = []
+    for doc in unique_documents:
+        source = compact_source_label(doc.metadata)
+        sections.append(f"[{labels[_document_key(doc)]}] ({source}):\n{doc.page_content.strip()}")
+
+    def render_groups(kept_labels):
+        return "\n".join(
+            f"Query {i} ({query}): {', '.join(label for label in group if label in kept_labels) or 'no relevant results'}"
+            for i, (query, group) in enumerate(zip(queries, query_labels), 1)
+        )
+
+    header_tokens = count_tokens(render_groups(set(labels.values()))) + count_tokens("="*50)
+    fitted = fit_to_token_budget(sections, max(token_budget - header_tokens, 0))
+    kept_labels = {f"S{i}" for i in range(1, len(fitted) + 1)}
+
+    return render_groups(kept_labels) + "\n\n" + "="*50 + "\n\n" + "\n\n".join(fitted)
+
+def search_knowledge_batch(queries: List[str], provider: str, k: int = SEARCH_RESULTS_K, mode: Optional[str] = None) -> str:
+    """Search the knowledge base for several queries at once and return grouped results"""
+    queries = [query for query in dict.fromkeys(q.strip() for q in queries) if query]
+    if not queries:
+        return NO_RESULTS_MESSAGE
+
+    results = retrieve_documents_batch(queries, provider, k * DUPLICATE_CANDIDATE_MULTIPLIER, mode)
+    results = [suppress_near_duplicates(documents, k) for documents in results]
+    if not any(results):
+        logger.warning(f"No results found for batch queries: {queries}")
+        return NO_RESULTS_MESSAGE
+
+    unique = len({_document_key(doc) for documents in results for doc in documents})
+    logger.info(f"Batch search for {len(queries)} queries returned {unique} unique documents")
+    return format_batch_search_results(queries, results)
+
+def get_query_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Return hit/miss counters of the query embedding and search result caches"""
+    return {
+        "query_embeddings": _query_embedding_cache.stats(),
+        "search_results": _search_result_cache.stats()
+    }
+
+def refresh_vector_store(provider: str = "openai") -> Dict[str, Any]:
+    """Re-scan ./data and incrementally update the shared store of a provider"""
+    vector_store = initialize_vector_store(provider)
+    with _get_provider_lock(provider):
+        return sync_vector_store(vector_store, provider)
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="CKD Knowledge Base Ingestion")
+
+    parser.add_argument('--provider', choices=['groq', 'openai'],
+                       default='groq', help='Embedding provider whose vector store to update')
+    parser.add_argument('--workers', type=int, default=INGEST_WORKERS,
+                       help='Number of processes used to parse and split files')
+    parser.add_argument('--export-numpy', action='store_true',
+                       help='Export the synced vector store into the memory-mapped NumPy index')
+    parser.add_argument('--numpy-dtype', choices=['float32', 'float16', 'int8'], default=NUMPY_INDEX_DTYPE,
+                       help='Storage type of the exported NumPy embedding matrix')
+
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    global INGEST_WORKERS
+    INGEST_WORKERS = args.workers
+
+    try:
+        report = refresh_vector_store(args.provider)
+        logger.info(f"Knowledge base ingestion completed: {report}")
+        if args.export_numpy:
+            info = export_vector_store_to_numpy(args.provider, args.numpy_dtype)
+            logger.info(f"NumPy index exported: {info}")
+        return 0
+    except Exception as e:
+        logger.error(f"Knowledge base ingestion failed: {e}")
+        return 1
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,87 @@
+"""
+CKD Lexical Index Module
+
+This module provides an in-process BM25 inverted index over knowledge base
+chunks and reciprocal rank fusion for combining it with dense retrieval.
+
+Features:
+- Tokenization that keeps clinical terms such as "eGFR", "SGLT2i" and "G3a" intact
+- Okapi BM25 scoring over an inverted index
+- Reciprocal rank fusion (RRF) of any number of ranked result lists
+"""
+
+import re
+import math
+import heapq
+from collections import Counter, defaultdict
+from typing import Any, Dict, Hashable, List, Sequence, Tuple
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this
+to was were with what which who how do does can should
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lower-cased word tokens without stopwords"""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOPWORDS]
+
+class BM25Index:
+    """Okapi BM25 ranking over a fixed list of documents"""
+
+    def __init__(self, documents: Sequence[Any], texts: Sequence[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+
+        for doc_index, text in enumerate(texts):
+            term_counts = Counter(tokenize(text))
+            self._lengths.append(sum(term_counts.values()))
+            for term, count in term_counts.items():
+                self._postings[term].append((doc_index, count))
+
+        total = len(self._lengths)
+        self._avg_length = (sum(self._lengths) / total) if total else 0.0
+        self._idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def search(self, query: str, k: int) -> List[Tuple[Any, float]]:
+        """Return up to k (document, score) pairs with a positive BM25 score"""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc_index, count in self._postings[term]:
+                length_norm = 1 - self.b + self.b * self._lengths[doc_index] / self._avg_length
+                scores[doc_index] += idf * count * (self.k1 + 1) / (count + self.k1 * length_norm)
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.documents[doc_index], score) for doc_index, score in best]
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Tuple[Hashable, Any]]], k: int, rrf_k: int = RRF_K) -> List[Any]:
+    """Fuse ranked lists of (key, item) pairs into a single top-k list
+
+    Each item scores sum(1 / (rrf_k + rank)) over the lists it appears in;
+    items are identified across lists by their key.
+    """
+    scores: Dict[Hashable, float] = defaultdict(float)
+    items: Dict[Hashable, Any] = {}
+    for ranking in rankings:
+        for rank, (key, item) in enumerate(ranking, 1):
+            scores[key] += 1.0 / (rrf_k + rank)
+            items.setdefault(key, item)
+
+    best = heapq.nlargest(k, scores.items(), key=lambda entry: entry[1])
+    return [items[key] for key, _ in best]
@@ -0,0 +1,305 @@
+"""
+CKD LLM Response Cache Module
+
+This module provides a persistent, content-addressed cache of LLM
+responses, so re-running a scenario or an assessment with exactly the same
+prompts does not call Groq/OpenAI again.
+
+Features:
+- SQLite store keyed by a hash of the model, sampling parameters, the full
+  message list and the offered tools
+- CachedLLM: drop-in CrewAI LLM subclass used by main.get_llm
+- Modes: "read-through" (serve hits, store misses), "write-through" (always
+  call the model and refresh the entry) and "bypass" (no cache access)
+- Size-based eviction of the least recently used entries
+- Hit/miss/write counters and on-disk size statistics
+- Calls that reach the provider are queued by llm_scheduler under the
+  provider's rate limits; cache hits are not
+
+Repeated samples of the same prompt (e.g. several simulations of one
+scenario) are told apart with llm_cache_sample(), so each simulation keeps
+its own cached response. Calls that execute functions (available_functions)
+and output that did not come from a completed provider call are never
+cached.
+
+Usage:
+    python llm_cache.py
+    python llm_cache.py --clear
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional
+
+from crewai.llm import LLM
+
+from llm_scheduler import get_llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_PATH = os.getenv("CKD_LLM_CACHE", "./llm_cache/responses.sqlite3")
+LLM_CACHE_MODES = ["read-through", "write-through", "bypass"]
+LLM_CACHE_MODE = os.getenv("CKD_LLM_CACHE_MODE", "read-through")
+LLM_CACHE_MAX_BYTES = int(float(os.getenv("CKD_LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+EVICTION_TARGET = 0.9
+
+# LLM attributes besides the messages that change the response
+KEY_ATTRIBUTES = ["model", "temperature", "top_p", "max_tokens", "max_completion_tokens", "stop",
+                  "seed", "response_format", "reasoning_effort"]
+
+_cache_sample: ContextVar[Optional[str]] = ContextVar("llm_cache_sample", default=None)
+# Set by CachedLLM while a provider call runs; marked once CrewAI reports a completed response
+_provider_completion: ContextVar[Optional[List[bool]]] = ContextVar("llm_provider_completion", default=None)
+
+@contextmanager
+def llm_cache_sample(sample: Any) -> Iterator[None]:
+    """Give the LLM calls made in this context their own cache entries
+
+    Used to keep repeated samples of the same prompt apart, e.g. one entry
+    per simulation number.
+    """
+    token = _cache_sample.set(str(sample))
+    try:
+        yield
+    finally:
+        _cache_sample.reset(token)
+
+def _canonical(value: Any) -> Any:
+    """Convert a value into something json.dumps can serialize deterministically"""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if hasattr(value, "model_json_schema"):
+        return value.model_json_schema()
+    return repr(value)
+
+def cache_key(llm: LLM, messages: Any, tools: Any = None) -> str:
+    """Return the cache key of an LLM call"""
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    payload = {
+        "params": {name: _canonical(getattr(llm, name, None)) for name in KEY_ATTRIBUTES},
+        "messages": _canonical(messages),
+        "tools": _canonical(tools),
+        "sample": _cache_sample.get()
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """SQLite-backed store of LLM responses with size-based LRU eviction"""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.bypassed = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response of a key, or None on a miss"""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_used = ?, hit_count = hit_count + 1 WHERE key = ?",
+                (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        """Store a response, evicting the least recently used entries if the cache is full"""
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used, hit_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, model, response, size, now, now)
+            )
+            self._total_bytes += size - (previous[0] if previous else 0)
+            self.writes += 1
+            if self._total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * EVICTION_TARGET))
+            self._conn.commit()
+
+    def _evict(self, target_bytes: int) -> None:
+        """Delete least recently used entries until the cache fits target_bytes; caller holds the lock"""
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= target_bytes:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+        logger.info(f"Evicted {len(evicted)} LLM cache entries to stay within {self.max_bytes} bytes")
+
+    def record_bypass(self) -> None:
+        """Count a call that skipped the cache"""
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self) -> None:
+        """Delete every cached response"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters of this process and the size of the store"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "bypassed": self.bypassed
+            }
+
+_shared_cache: Optional[LLMResponseCache] = None
+_shared_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMResponseCache:
+    """Return the process-wide LLM response cache"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = LLMResponseCache()
+        return _shared_cache
+
+class CachedLLM(LLM):
+    """CrewAI LLM that serves repeated calls from the persistent response cache"""
+
+    def __init__(self, *args, cache_mode: Optional[str] = None, cache: Optional[LLMResponseCache] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_mode = cache_mode or LLM_CACHE_MODE
+        if self.cache_mode not in LLM_CACHE_MODES:
+            raise ValueError(f"Unsupported LLM cache mode: {self.cache_mode}. Use one of {', '.join(LLM_CACHE_MODES)}")
+        self.cache = cache
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        """Call the model, consulting the response cache according to the cache mode"""
+        cache = self.cache or get_llm_cache()
+        if self.cache_mode == "bypass" or available_functions:
+            # Function-executing calls have side effects and must always run
+            cache.record_bypass()
+            return self._scheduled_call(messages, tools, callbacks, available_functions, **kwargs)[0]
+
+        key = cache_key(self, messages, tools)
+        if self.cache_mode == "read-through":
+            cached = cache.get(key)
+            if cached is not None:
+                logger.debug(f"LLM cache hit for {self.model} ({key[:12]})")
+                return cached
+
+        response, completed = self._scheduled_call(messages, tools, callbacks, available_functions, **kwargs)
+        # Only real provider completions are stored, never error-path or fallback output
+        if completed and isinstance(response, str) and response.strip():
+            cache.put(key, self.model, response)
+        return response
+
+    def _scheduled_call(self, messages, tools, callbacks, available_functions, **kwargs):
+        """Call the model through the rate-limit aware request scheduler
+
+        Returns:
+            Tuple of (response, completed); completed is True only if the
+            provider returned a completion for this call
+        """
+        call = partial(super().call, messages, tools=tools, callbacks=callbacks,
+                       available_functions=available_functions, **kwargs)
+        completion: List[bool] = []
+        token = _provider_completion.set(completion)
+        try:
+            response = get_llm_scheduler().run(self.model, call, messages, getattr(self, "max_tokens", None))
+        finally:
+            _provider_completion.reset(token)
+        # CrewAI versions without the completion event hook only return on success
+        completed = bool(completion) or not hasattr(LLM, "_handle_emit_call_events")
+        return response, completed
+
+    def _handle_emit_call_events(self, response, *args, **kwargs):
+        """Mark the running call as completed by the provider before emitting CrewAI's completion event"""
+        completion = _provider_completion.get()
+        if completion is not None:
+            completion.append(True)
+        return super()._handle_emit_call_events(response, *args, **kwargs)
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="CKD LLM Response Cache")
+
+    parser.add_argument('--clear', action='store_true',
+                       help='Delete every cached response')
+
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    try:
+        cache = get_llm_cache()
+        if args.clear:
+            cache.clear()
+            logger.info(f"Cleared LLM response cache {cache.path}")
+        stats = cache.stats()
+        logger.info(f"LLM response cache {cache.path}: {stats['entries']} entries, "
+                    f"{stats['bytes'] / 1024 / 1024:.1f} of {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+        return 0
+    except Exception as e:
+        logger.error(f"LLM cache command failed: {e}")
+        return 1
+
+if __name__ == "__main__":
+    exit(main())
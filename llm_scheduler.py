@@ -0,0 +1,375 @@
+"""
+CKD LLM Request Scheduler Module
+
+This module schedules every LLM request that reaches a provider, so
+concurrent simulations run at the provider's rate limits instead of
+alternating between bursts and rate-limit failures.
+
+Features:
+- Process-wide limit on concurrent LLM requests, adjustable at runtime
+- Per provider/model token buckets for requests per minute and tokens per
+  minute, with limits from CKD_<PROVIDER>_RPM / CKD_<PROVIDER>_TPM
+- Calls wait in a first-come, first-served queue per model until both
+  budgets allow them
+- Token budget reserved from an estimate of the prompt and completion size
+  and settled against the actual response once it arrives
+- Rate-limit (429) errors pause the whole model queue until the server's
+  retry-after hint and are retried; without a hint the queue backs off
+  exponentially and the rate is lowered, recovering with successful calls
+- Queue depth, wait time, retry and token counters per model
+- Used by llm_cache.CachedLLM for every request that reaches the provider
+  (cache hits do not take a slot)
+
+Usage:
+    python llm_scheduler.py
+"""
+
+import os
+import re
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("CKD_LLM_MAX_IN_FLIGHT", "4"))
+LLM_MAX_RETRIES = int(os.getenv("CKD_LLM_MAX_RETRIES", "5"))
+# Completion tokens reserved per request until the actual response is known
+LLM_COMPLETION_TOKENS = int(os.getenv("CKD_LLM_COMPLETION_TOKENS", "1024"))
+CHARS_PER_TOKEN = 4
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+# Rate factor after a 429 (multiplied) and per successful call (added back)
+RATE_DECREASE = 0.5
+RATE_RECOVERY = 0.05
+MIN_RATE_FACTOR = 0.1
+
+# Default (requests per minute, tokens per minute) per provider; 0 disables a limit
+DEFAULT_RATE_LIMITS = {
+    "groq": (30, 6000),
+    "openai": (500, 30000)
+}
+
+def rate_limits(provider: str) -> Tuple[int, int]:
+    """Return the (requests per minute, tokens per minute) limits of a provider"""
+    rpm, tpm = DEFAULT_RATE_LIMITS.get(provider, (0, 0))
+    prefix = f"CKD_{provider.upper()}"
+    return int(os.getenv(f"{prefix}_RPM", rpm)), int(os.getenv(f"{prefix}_TPM", tpm))
+
+def estimate_tokens(content: Any) -> int:
+    """Rough token count of a prompt (string or message list) or a response"""
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN + 1
+    if isinstance(content, list):
+        return sum(estimate_tokens(message.get("content") or message.get("text") or "" if isinstance(message, dict) else message)
+                   for message in content)
+    return estimate_tokens(str(content)) if content is not None else 0
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether an exception is a provider rate-limit (HTTP 429) error"""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse a retry hint such as "7", "250ms", "7.66s" or "1m2.5s" into seconds"""
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Return the server's retry hint of a rate-limit error, if any
+
+    Looks at the retry-after(-ms) and x-ratelimit-reset-* response headers
+    and at the "try again in ..." hint Groq and OpenAI put in the message.
+    """
+    response = getattr(error, "response", None)
+    headers = dict(getattr(error, "litellm_response_headers", None) or getattr(response, "headers", None) or {})
+    headers = {str(name).lower(): value for name, value in headers.items()}
+    if "retry-after-ms" in headers:
+        seconds = _parse_duration(headers["retry-after-ms"])
+        if seconds is not None:
+            return seconds / 1000
+    for name in ("retry-after", "x-ratelimit-reset-tokens", "x-ratelimit-reset-requests"):
+        if name in headers:
+            seconds = _parse_duration(headers[name])
+            if seconds is not None:
+                return seconds
+    match = re.search(r"try again in ((?:\d+(?:\.\d+)?(?:ms|h|m|s))+)", str(error), re.IGNORECASE)
+    return _parse_duration(match.group(1)) if match else None
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate; rate 0 means unlimited"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def limited(self) -> bool:
+        return self.capacity > 0
+
+    def refill(self, now: float, factor: float = 1.0) -> None:
+        if self.limited:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity * factor / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, factor: float = 1.0) -> float:
+        """Seconds until the bucket holds amount (capped at its capacity)"""
+        if not self.limited:
+            return 0.0
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing * 60.0 / (self.capacity * factor))
+
+    def take(self, amount: float) -> None:
+        if self.limited:
+            self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        if self.limited:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+class ModelLimiter:
+    """First-come, first-served queue over the request and token buckets of one provider/model"""
+
+    def __init__(self, model: str, rpm: int, tpm: int):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.rate_factor = 1.0
+        self.blocked_until = 0.0
+        self._condition = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+        # Metrics
+        self.calls = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.rate_limited = 0
+        self.retries = 0
+        self.tokens_used = 0
+
+    def acquire(self, tokens: int) -> float:
+        """Wait in the queue until the model's budgets allow a request; return the seconds waited"""
+        start_time = time.monotonic()
+        with self._condition:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            while True:
+                now = time.monotonic()
+                self.requests.refill(now, self.rate_factor)
+                self.tokens.refill(now, self.rate_factor)
+                if ticket == self._serving:
+                    delay = max(self.blocked_until - now,
+                                self.requests.wait_time(1, self.rate_factor),
+                                self.tokens.wait_time(tokens, self.rate_factor))
+                    if delay <= 0:
+                        break
+                    self._condition.wait(delay)
+                else:
+                    self._condition.wait()
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self._serving += 1
+            self.queued -= 1
+            self.calls += 1
+            waited = time.monotonic() - start_time
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self._condition.notify_all()
+        return waited
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Give back the reserved tokens a finished request did not use"""
+        with self._condition:
+            self.tokens_used += used
+            if reserved > used:
+                self.tokens.give_back(reserved - used)
+            self.rate_factor = min(1.0, self.rate_factor + RATE_RECOVERY)
+            self._condition.notify_all()
+
+    def refund(self, reserved: int) -> None:
+        """Give back the tokens reserved by a request that failed without a response"""
+        with self._condition:
+            self.tokens.give_back(reserved)
+            self._condition.notify_all()
+
+    def back_off(self, delay: float, reserved: int, hinted: bool, retry: bool = True) -> None:
+        """Pause the queue after a rate-limit error
+
+        The tokens reserved by the rejected request are given back. The rate
+        is only lowered when the server gave no retry hint; a hint already
+        says when the budget is available again.
+        """
+        with self._condition:
+            self.rate_limited += 1
+            self.retries += int(retry)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            self.tokens.give_back(reserved)
+            if not hinted:
+                self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor * RATE_DECREASE)
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "rpm": int(self.requests.capacity),
+                "tpm": int(self.tokens.capacity),
+                "rate_factor": round(self.rate_factor, 2),
+                "calls": self.calls,
+                "queue_depth": self.queued,
+                "peak_queue_depth": self.peak_queued,
+                "mean_wait_seconds": round(self.total_wait_seconds / self.calls, 3) if self.calls else 0.0,
+                "max_wait_seconds": round(self.max_wait_seconds, 3),
+                "rate_limited": self.rate_limited,
+                "retries": self.retries,
+                "tokens_used": self.tokens_used
+            }
+
+class LLMScheduler:
+    """Schedules LLM requests under per-model rate limits and a global in-flight limit"""
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, max_retries: int = LLM_MAX_RETRIES):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self._condition = threading.Condition()
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._limiters_lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.waiting = 0
+        self.requests = 0
+        self.total_wait_seconds = 0.0
+
+    def set_max_in_flight(self, max_in_flight: int) -> None:
+        """Change the limit; waiting requests are woken up if it grew"""
+        with self._condition:
+            self.max_in_flight = max(1, max_in_flight)
+            self._condition.notify_all()
+
+    def limiter(self, model: str) -> ModelLimiter:
+        """Return the rate limiter of a model such as "groq/llama-3.3-70b-versatile" """
+        with self._limiters_lock:
+            if model not in self._limiters:
+                provider = model.split("/", 1)[0] if "/" in model else "openai"
+                rpm, tpm = rate_limits(provider)
+                self._limiters[model] = ModelLimiter(model, rpm, tpm)
+                logger.info(f"Rate limits for {model}: {rpm or 'unlimited'} requests/min, {tpm or 'unlimited'} tokens/min")
+            return self._limiters[model]
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one in-flight request slot for the duration of the block"""
+        start_time = time.perf_counter()
+        with self._condition:
+            self.waiting += 1
+            while self.in_flight >= self.max_in_flight:
+                self._condition.wait()
+            self.waiting -= 1
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.total_wait_seconds += time.perf_counter() - start_time
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    def run(self, model: str, call: Callable[[], Any], prompt: Any = None,
+            completion_tokens: Optional[int] = None) -> Any:
+        """Run an LLM call once the model's budgets and an in-flight slot allow it
+
+        Rate-limit errors are retried up to max_retries times after the
+        server's retry hint; other errors are raised unchanged.
+
+        Args:
+            model: Provider-prefixed model name, keys the rate limiter
+            call: Performs the request and returns the response
+            prompt: Prompt string or message list, used to estimate tokens
+            completion_tokens: Completion tokens to reserve, defaults to
+                CKD_LLM_COMPLETION_TOKENS
+        """
+        limiter = self.limiter(model)
+        prompt_tokens = estimate_tokens(prompt)
+        reserved = prompt_tokens + (completion_tokens or LLM_COMPLETION_TOKENS)
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire(reserved)
+            try:
+                with self.slot():
+                    response = call()
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    limiter.refund(reserved)
+                    raise
+                delay = retry_after_seconds(e)
+                hinted = delay is not None
+                if not hinted:
+                    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+                delay += random.uniform(0, 0.25 * delay)
+                retry = attempt < self.max_retries
+                limiter.back_off(delay, reserved, hinted, retry)
+                if not retry:
+                    raise
+                logger.warning(f"Rate limited by {model}; retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                continue
+            limiter.settle(reserved, prompt_tokens + estimate_tokens(response))
+            return response
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the in-flight counters and the queue, wait-time and retry counters per model"""
+        with self._condition:
+            stats = {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "waiting": self.waiting,
+                "requests": self.requests,
+                "mean_wait_seconds": round(self.total_wait_seconds / self.requests, 3) if self.requests else 0.0
+            }
+        with self._limiters_lock:
+            limiters = list(self._limiters.values())
+        stats["models"] = {limiter.model: limiter.stats() for limiter in limiters}
+        return stats
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Return the process-wide LLM request scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
+
+def main():
+    """Print the configured rate limits"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    for provider in DEFAULT_RATE_LIMITS:
+        rpm, tpm = rate_limits(provider)
+        print(f"{provider}: {rpm or 'unlimited'} requests/min, {tpm or 'unlimited'} tokens/min")
+    print(f"max in flight: {LLM_MAX_IN_FLIGHT}, max retries: {LLM_MAX_RETRIES}, "
+          f"reserved completion tokens: {LLM_COMPLETION_TOKENS}")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,18 +1,22 @@
-import os
 import streamlit as st
 import logging
 from dotenv import load_dotenv
-from crewai import Agent, Task, Crew, Process
-from crewai.llm import LLM  # Import CrewAI's LLM class
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores import Chroma
-from langchain.document_loaders import DirectoryLoader, TextLoader
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from crewai import Agent
+from llm_cache import CachedLLM, get_llm_cache
+from llm_scheduler import get_llm_scheduler
+from knowledge_base import get_search_index, invalidate_vector_store, search_knowledge, search_knowledge_batch, get_query_cache_stats, DEFAULT_RETRIEVAL_MODE
 from propmpts import qna_agent_prompt, questions_list, diagnostic_agent_prompt, research_agent_prompt, coordinator_agent_prompt, critique_agent_prompt, presentation_agent_prompt
+from factor_passages import build_research_context
+from patient_parser import parse_patient_responses, LOCAL_PARSE_ENABLED
+from risk_scoring import get_risk_model, format_risk_score
+from routing import decide_route
+from assessment_cache import get_assessment_cache, assessment_key, ASSESSMENT_CACHE_ENABLED
+from pipeline import crew_templates, crew_inputs, describe_profile, SELECTABLE_PROFILES, DEFAULT_PIPELINE_PROFILE
+from cohort import get_cohort_index, SIMILAR_PATIENTS_K
+from cohort_summary import get_cohort_summary_text
 from models import PatientQnA
 import json
+from datetime import datetime
 from PIL import Image
 import io
 from crewai.tools import tool, BaseTool
@@ -116,14 +120,16 @@ st.set_page_config(
 )
 
 # LLM Provider selection - updated to use CrewAI's LLM class
-def get_llm(provider, model=None):
+def get_llm(provider, model=None, cache_mode=None):
     global _current_provider
     _current_provider = provider  # Update global provider
     
+    # Responses are cached on disk; cache_mode overrides CKD_LLM_CACHE_MODE
     if provider == "openai":
-        return LLM(
+        return CachedLLM(
             model="openai/gpt-4o",
-            temperature=0.2
+            temperature=0.2,
+            cache_mode=cache_mode
         )
     elif provider == "groq":
         groq_models = {
@@ -132,79 +138,63 @@ def get_llm(provider, model=None):
             "mistral": "mixtral-8x7b-32768"
         }
         selected_model = groq_models.get(model, "llama-3.3-70b-versatile")
-        return LLM(
+        return CachedLLM(
             model=f"groq/{selected_model}",
-            temperature=0.2
+            temperature=0.2,
+            cache_mode=cache_mode
         )
     else:
         raise ValueError(f"Unsupported provider: {provider}")
 
-# Get embeddings based on LLM provider
-def get_embeddings(provider):
-    if provider == "openai":
-        return OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
-    else:  # groq models
-        return HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-# Initialize vector store
-def initialize_vector_store(provider="openai"):
-    db_path = f"./chroma_db_{provider}"
-    
-    # Check if we already have a vector store for this provider
-    if os.path.exists(db_path):
-        # Load existing vector store
-        embeddings = get_embeddings(provider)
-        return Chroma(persist_directory=db_path, embedding_function=embeddings)
-    
-    # Create new vector store
-    # Load documents from data directory (PDFs and TXT files)
-    pdf_loader = DirectoryLoader("./data", glob="**/*.pdf", loader_cls=PyPDFLoader)
-    txt_loader = DirectoryLoader("./data", glob="**/*.txt", loader_cls=TextLoader)
-    
-    pdf_documents = pdf_loader.load()
-    txt_documents = txt_loader.load()
-    documents = pdf_documents + txt_documents
-    
-    logger.info(f"Loaded {len(pdf_documents)} PDF documents and {len(txt_documents)} TXT documents")
-    
-    # Split documents into chunks
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    chunks = text_splitter.split_documents(documents)
-    
-    # Create vector store
-    embeddings = get_embeddings(provider)
-    vector_store = Chroma.from_documents(
-        documents=chunks, 
-        embedding=embeddings,
-        persist_directory=db_path
-    )
-    vector_store.persist()
-    return vector_store
-
 # Load patient response data
-def load_patient_data():
+def load_patient_data(current_patient_data=None, k=SIMILAR_PATIENTS_K):
     try:
-        # Load past patient responses
-        with open("data/past_patient_responses.json", "r") as f:
-            past_data = json.load(f)
+        # Aggregated cohort statistics, rebuilt only when the response files change
+        cohort_summary = get_cohort_summary_text()
         
-        # Load present patient responses
-        with open("data/present_patient_responses.json", "r") as f:
-            present_data = json.load(f)
+        # The k historical patients most similar to the current one, as a compact table;
+        # the columnar cohort is parsed once per process and tables are memoized per answers
+        if not current_patient_data:
+            return cohort_summary, "No current answers to compare yet."
+        similar_patients = get_cohort_index().format_similar_patients(current_patient_data, k)
         
-        # Limit the data to a reasonable size for the prompt
-        # Take first 5 patients as examples
-        past_sample = past_data[:5]
-        present_sample = present_data[:5]
-        
-        return json.dumps(past_sample, indent=1), json.dumps(present_sample, indent=1)
+        return cohort_summary, similar_patients
     except FileNotFoundError:
         # Return empty data if files don't exist
         print("Warning: Patient response data files not found. Run scripts/data_converter.py first.")
-        return "[]", "[]"
+        return "No historical data available.", "No historical data available."
     except Exception as e:
         print(f"Error loading patient data: {str(e)}")
-        return "[]", "[]"
+        return "No historical data available.", "No historical data available."
+
+def get_guideline_passages(patient_responses_json, provider):
+    """Precomputed guideline passages for the patient's positive risk factors"""
+    try:
+        context = build_research_context(json.loads(patient_responses_json), provider)
+    except Exception as e:
+        logger.error(f"Error loading precomputed guideline passages: {str(e)}")
+        context = None
+    if context is None:
+        return "No precomputed passages available - use the search tools for guideline references."
+    return context
+
+def get_risk_prescore(patient_responses_json):
+    """Local risk pre-score of the patient for the research agent"""
+    try:
+        return format_risk_score(get_risk_model().score(json.loads(patient_responses_json)))
+    except Exception as e:
+        logger.error(f"Error computing local risk pre-score: {str(e)}")
+        return "No pre-score available."
+
+def get_research_inputs(patient_responses_json, provider):
+    """Per-patient placeholders of the research agent prompt"""
+    cohort_summary, similar_patients = load_patient_data(patient_responses_json)
+    return {
+        "cohort_summary": cohort_summary,
+        "similar_patients": similar_patients,
+        "guideline_passages": get_guideline_passages(patient_responses_json, provider),
+        "risk_prescore": get_risk_prescore(patient_responses_json)
+    }
 
 @tool("Analyze Diagnostic Image")
 def analyze_diagnostic_image(image_bytes: str) -> str:
@@ -213,41 +203,42 @@ def analyze_diagnostic_image(image_bytes: str) -> str:
     # For now, we'll return a placeholder response
     return "Analysis of diagnostic image shows potential indicators of kidney function changes."
 
+def _get_search_provider():
+    """Get current provider from global variable or session state"""
+    if hasattr(st, 'session_state') and 'current_llm_provider' in st.session_state:
+        return st.session_state.current_llm_provider
+    provider = _current_provider
+    if provider is None:
+        raise ValueError(f"No LLM provider set! Current provider: {_current_provider}, Session state available: {hasattr(st, 'session_state')}")
+    return provider
+
 @tool("Search Medical Knowledge")
-def search_medical_knowledge(query: str) -> str:
-    """Search for relevant medical information about chronic kidney disease from KDIGO guidelines and medical literature"""
+def search_medical_knowledge(query: str, mode: str = DEFAULT_RETRIEVAL_MODE) -> str:
+    """Search for relevant medical information about chronic kidney disease from KDIGO guidelines and medical literature.
+    mode: "hybrid" (default, keyword + semantic), "lexical" (exact terms such as eGFR, ACR, SGLT2i, G3a) or "vector" (semantic only)"""
     try:
-        # Get current provider from global variable or session state
-        if hasattr(st, 'session_state') and 'current_llm_provider' in st.session_state:
-            provider = st.session_state.current_llm_provider
-        else:
-            provider = _current_provider
-            if provider is None:
-                raise ValueError(f"No LLM provider set! Current provider: {_current_provider}, Session state available: {hasattr(st, 'session_state')}")
-        vector_store = initialize_vector_store(provider)
-        logger.info(f"Searching medical knowledge for: {query} using {provider} embeddings")
-        
-        # Search for relevant documents
-        results = vector_store.similarity_search(query, k=5)
+        provider = _get_search_provider()
+        logger.info(f"Searching medical knowledge for: {query} using {provider} embeddings ({mode} mode)")
         
-        if not results:
-            logger.warning(f"No results found for query: {query}")
-            return "No relevant medical information found for this query."
+        # Cached search: repeated queries skip embedding and retrieval
+        return search_knowledge(query, provider, mode=mode)
         
-        # Format the results with source information
-        formatted_results = []
-        for i, doc in enumerate(results, 1):
-            source = doc.metadata.get('source', 'Unknown source')
-            content = doc.page_content.strip()
-            formatted_results.append(f"Source {i} ({source}):\n{content}")
-        
-        combined_results = "\n\n" + "="*50 + "\n\n".join(formatted_results)
-        logger.info(f"Found {len(results)} relevant documents for query: {query}")
+    except Exception as e:
+        logger.error(f"Error searching medical knowledge: {str(e)}")
+        return f"Error accessing medical knowledge base: {str(e)}"
+
+@tool("Search Medical Knowledge Batch")
+def search_medical_knowledge_batch(queries: List[str], mode: str = DEFAULT_RETRIEVAL_MODE) -> str:
+    """Search KDIGO guidelines and medical literature for several queries at once, e.g. one query per risk factor.
+    Returns results grouped by query; passages shared between queries are listed once. mode is as for Search Medical Knowledge."""
+    try:
+        provider = _get_search_provider()
+        logger.info(f"Batch searching medical knowledge for {len(queries)} queries using {provider} embeddings ({mode} mode)")
         
-        return combined_results
+        return search_knowledge_batch(queries, provider, mode=mode)
         
     except Exception as e:
-        logger.error(f"Error searching medical knowledge: {str(e)}")
+        logger.error(f"Error batch searching medical knowledge: {str(e)}")
         return f"Error accessing medical knowledge base: {str(e)}"
 
 # Add this custom tool for asking questions
@@ -364,6 +355,13 @@ def main():
     else:
         llm = get_llm(llm_provider)
     
+    pipeline_profile = st.sidebar.selectbox(
+        "Select Pipeline Profile", SELECTABLE_PROFILES,
+        index=SELECTABLE_PROFILES.index(DEFAULT_PIPELINE_PROFILE) if DEFAULT_PIPELINE_PROFILE in SELECTABLE_PROFILES else 0,
+        help="Trade assessment depth for fewer LLM calls"
+    )
+    st.sidebar.caption(describe_profile(pipeline_profile))
+    
     # Add session management
     st.sidebar.title("Session Management")
     if st.sidebar.button("🔄 Reset Session", help="Clear all questions and answers to start fresh"):
@@ -381,6 +379,11 @@ def main():
         st.sidebar.success("Session reset! Refresh the page to start fresh.")
         st.rerun()
     
+    if st.sidebar.button("♻️ Reload Knowledge Base", help="Reopen the medical knowledge vector store on the next search"):
+        invalidate_vector_store(llm_provider)
+        logger.info(f"Knowledge base reload requested for provider: {llm_provider}")
+        st.sidebar.success("Knowledge base will be reloaded on the next search.")
+    
     # Display current session info
     if "questions" in st.session_state:
         st.sidebar.info(f"📋 Questions loaded: {len(st.session_state.questions)}")
@@ -390,6 +393,16 @@ def main():
             progress = st.session_state.current_question_index / len(st.session_state.questions)
             st.sidebar.progress(progress, text=f"Progress: {st.session_state.current_question_index}/{len(st.session_state.questions)}")
     
+    cache_stats = get_query_cache_stats()["search_results"]
+    st.sidebar.caption(f"🔎 Knowledge search cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+    llm_cache_stats = get_llm_cache().stats()
+    assessment_cache_stats = get_assessment_cache().stats()
+    st.sidebar.caption(f"⚡ Assessment cache: {assessment_cache_stats['hits']} hits / {assessment_cache_stats['misses']} misses, {assessment_cache_stats['entries']} stored")
+    st.sidebar.caption(f"💬 LLM response cache: {llm_cache_stats['hits']} hits / {llm_cache_stats['misses']} misses, {llm_cache_stats['entries']} stored")
+    for scheduled_model, model_stats in get_llm_scheduler().stats()["models"].items():
+        st.sidebar.caption(f"⏱️ {scheduled_model}: {model_stats['calls']} calls, {model_stats['queue_depth']} queued, "
+                           f"{model_stats['mean_wait_seconds']}s mean wait, {model_stats['rate_limited']} rate limited")
+    
     # Initialize session state for chat history
     if "messages" not in st.session_state:
         st.session_state.messages = []
@@ -516,40 +529,60 @@ def main():
                 collected_answers_json = json.dumps(st.session_state.collected_answers, indent=2)
                 logger.info(f"Starting crew analysis with {len(st.session_state.collected_answers)} patient responses")
                 
-                # Create agents with current patient data
-                qna_agent, research_agent, diagnostic_agent, critique_agent, presentation_agent = create_agents(llm, collected_answers_json)
+                # Structure the answers locally so the QnA agent task can be skipped
+                parsed_patient = parse_patient_responses(st.session_state.collected_answers)
+                if not parsed_patient.complete:
+                    logger.info(f"Local parsing incomplete ({', '.join(parsed_patient.unparsed_fields)}) - keeping the QnA agent task")
                 
-                # Create tasks with the collected answers
-                tasks = create_tasks(qna_agent, research_agent, diagnostic_agent, critique_agent, presentation_agent, collected_answers_json)
+                # Clear-cut low-risk cases take a shortened pipeline
+                has_diagnostic_image = "diagnostic_image" in st.session_state
+                route = decide_route(parsed_patient, has_diagnostic_image=has_diagnostic_image)
+                st.session_state.last_route = route
                 
-                # Add image analysis if available
-                if "diagnostic_image" in st.session_state:
-                    diagnostic_agent.tools = [analyze_diagnostic_image]
+                # Identical answer sets reuse a finished assessment; image analyses are never cached
+                cache_key = None
+                cached = None
+                if ASSESSMENT_CACHE_ENABLED and not has_diagnostic_image:
+                    cache_key = assessment_key(parsed_patient, llm.model, pipeline_profile, route["route"])
+                    cached = get_assessment_cache().get(cache_key)
+                st.session_state.last_assessment_cached = cached
                 
-                # Create crew with provider-specific memory configuration
-                crew = Crew(
-                    agents=[qna_agent, research_agent, diagnostic_agent, critique_agent, presentation_agent],
-                    tasks=tasks,
-                    verbose=True,
-                    process=Process.sequential,
-                    memory=False if st.session_state.current_llm_provider == "groq" else True  # Disable memory for Groq to avoid embedding issues
-                )
-                
-                # Add image analysis if available
-                if "diagnostic_image" in st.session_state:
-                    diagnostic_agent.tools = [analyze_diagnostic_image]
-                    logger.info("Diagnostic image available for analysis")
-                
-                # Run the crew
-                logger.info("Starting CrewAI execution...")
-                result = crew.kickoff()
-                logger.info(f"CrewAI execution completed successfully. Result type: {type(result)}")
-                
-                # Log result structure for debugging
-                if hasattr(result, 'raw'):
-                    logger.info(f"CrewOutput.raw length: {len(str(result.raw))}")
+                if cached is not None:
+                    logger.info(f"Serving cached assessment {cache_key[:12]} (hit {cached['hit_count']})")
+                    result = cached["result"]
                 else:
-                    logger.info(f"Result string length: {len(str(result))}")
+                    # Copy of the crew template for this provider, model and task plan
+                    provider = st.session_state.current_llm_provider
+                    parsed_complete = LOCAL_PARSE_ENABLED and parsed_patient.complete
+                    crew = crew_templates.get(
+                        (provider, llm.model), lambda: create_agents(llm), parsed_complete, route["route"], pipeline_profile,
+                        verbose=True,
+                        memory=False if provider == "groq" else True  # Disable memory for Groq to avoid embedding issues
+                    )
+                    st.session_state.last_pipeline = f"{pipeline_profile} profile, {route['route']} route, {len(crew.tasks)} LLM calls expected"
+                    
+                    # The diagnostic agent always carries the image analysis tool
+                    if has_diagnostic_image:
+                        logger.info("Diagnostic image available for analysis")
+                    
+                    # Fill the patient-specific placeholders of the agents and tasks
+                    inputs = crew_inputs(collected_answers_json, parsed_patient if parsed_complete else None,
+                                         **get_research_inputs(collected_answers_json, provider))
+                    
+                    # Run the crew
+                    logger.info("Starting CrewAI execution...")
+                    result = crew.kickoff(inputs=inputs)
+                    logger.info(f"CrewAI execution completed successfully. Result type: {type(result)}")
+                    
+                    # Log result structure for debugging
+                    if hasattr(result, 'raw'):
+                        logger.info(f"CrewOutput.raw length: {len(str(result.raw))}")
+                    else:
+                        logger.info(f"Result string length: {len(str(result))}")
+                    
+                    if cache_key is not None:
+                        get_assessment_cache().put(cache_key, str(result.raw) if hasattr(result, 'raw') else str(result),
+                                                   {"route": route, "pipeline": st.session_state.last_pipeline})
                 
             except Exception as e:
                 logger.error(f"Error during crew execution: {str(e)}")
@@ -561,6 +594,13 @@ def main():
         
         with st.chat_message("assistant"):
             st.markdown(processed_result)
+            cached = st.session_state.get("last_assessment_cached")
+            if cached is not None:
+                cached_at = datetime.fromtimestamp(cached["created_at"]).strftime("%Y-%m-%d %H:%M")
+                st.caption(f"⚡ Served from the assessment cache: identical answers were assessed on {cached_at}")
+                st.caption(f"Pipeline: {cached['metadata'].get('pipeline', 'cached')}")
+            elif "last_route" in st.session_state:
+                st.caption(f"Pipeline: {st.session_state.get('last_pipeline', st.session_state.last_route['route'])} ({st.session_state.last_route['reason']})")
         
         # Add to chat history (convert CrewOutput to string for consistency)
         result_str = str(result.raw) if hasattr(result, 'raw') else str(result)
@@ -595,14 +635,11 @@ def main():
             # Rerun to wait for answer
             st.rerun()
 
-# Define agents
-def create_agents(llm, current_patient_data=None):
-    # Initialize vector store for RAG with matching provider
+# Define agents; patient-specific prompt parts stay as placeholders filled in by crew.kickoff(inputs=...)
+def create_agents(llm):
+    # Warm the shared search index for RAG with matching provider
     provider = st.session_state.get('current_llm_provider', 'openai')
-    vector_store = initialize_vector_store(provider)
-    
-    # Load historical patient data for research agent context
-    past_patient_qna, present_patient_qna = load_patient_data()
+    get_search_index(provider)
     
     # QnA Agent
     qna_prompt = qna_agent_prompt.format(questions_list=questions_list)
@@ -615,26 +652,14 @@ def create_agents(llm, current_patient_data=None):
         tools=[QuestionAsker()]  # Use our custom tool
     )
     
-    # Research Agent - include current patient data if available
-    if current_patient_data:
-        ra_prompt = research_agent_prompt.format(
-            past_patient_qna=past_patient_qna, 
-            present_patient_qna=present_patient_qna,
-            current_patient_responses=current_patient_data
-        )
-    else:
-        ra_prompt = research_agent_prompt.format(
-            past_patient_qna=past_patient_qna, 
-            present_patient_qna=present_patient_qna
-        )
-    
+    # Research Agent - current patient data, historical data and passages come from the kickoff inputs
     research_agent = Agent(
         role="Research Agent",
         goal="Research CKD and assess risk percentage based on current patient's responses and historical data patterns.",
-        backstory=ra_prompt,
+        backstory=research_agent_prompt,
         verbose=True,
         llm=llm,
-        tools=[search_medical_knowledge]
+        tools=[search_medical_knowledge_batch, search_medical_knowledge]
     )
     
     # Diagnostic Agent
@@ -667,74 +692,5 @@ def create_agents(llm, current_patient_data=None):
     
     return qna_agent, research_agent, diagnostic_agent, critique_agent, presentation_agent
 
-# Define tasks
-def create_tasks(qna_agent, research_agent, diagnostic_agent, critique_agent, presentation_agent, collected_patient_data):
-    # Task 1: QnA agent processes collected patient information
-    collect_info_task = Task(
-        description=f"""
-        Process the following patient responses collected from the questionnaire:
-        
-        {collected_patient_data}
-        
-        Your task is to:
-        1. Review and validate the collected patient responses
-        2. Organize the information in a structured format
-        3. Identify any missing or unclear responses that might need clarification
-        4. Format the data for analysis by other agents
-        
-        Focus on ensuring data quality and completeness for CKD risk assessment.
-        """,
-        agent=qna_agent,
-        expected_output="Structured and validated patient questionnaire responses in JSON format"
-    )
-    
-    # Task 2: Diagnostic agent analyzes patient data
-    diagnostic_task = Task(
-        description="Analyze the patient's responses and any diagnostic images to assess potential kidney issues",
-        agent=diagnostic_agent,
-        dependencies=[collect_info_task],
-        expected_output="Diagnostic analysis of patient data and images"
-    )
-    
-    # Task 3: Research agent makes comprehensive risk assessment
-    research_task = Task(
-        description="""
-        Conduct a comprehensive CKD risk assessment using:
-        1. Patient questionnaire responses from the QnA agent
-        2. Diagnostic analysis from the diagnostic agent
-        3. Historical patient data patterns
-        4. KDIGO guidelines and medical knowledge
-        
-        Provide detailed factor analysis with:
-        - Individual risk percentage for each factor
-        - Evidence-based explanations
-        - Overall risk calculation
-        - Top 3 most concerning factors
-        """,
-        agent=research_agent,
-        dependencies=[collect_info_task, diagnostic_task],
-        expected_output="Comprehensive CKD risk assessment with detailed factor analysis and percentage contributions"
-    )
-    
-    # Task 4: Critique agent reviews the assessment
-    critique_task = Task(
-        description="Review and critique the CKD risk assessment for accuracy and completeness",
-        agent=critique_agent,
-        dependencies=[research_task],
-        expected_output="Final verified CKD assessment with critique and corrections"
-    )
-    
-    # Add new Presentation task
-    presentation_task = Task(
-        description="Create a clear, user-friendly presentation of the CKD assessment results",
-        agent=presentation_agent,
-        dependencies=[critique_task],
-        expected_output="User-friendly CKD assessment report"
-    )
-    
-    tasks = [collect_info_task, diagnostic_task, research_task, critique_task, presentation_task]
-    
-    return tasks
-
 if __name__ == "__main__":
     main()
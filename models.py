@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Literal
+from typing import Dict, List, Optional, Literal
 from datetime import date
 
 class MedicalHistory(BaseModel):
@@ -41,3 +41,12 @@ class PatientData(BaseModel):
 class PatientQnA(BaseModel):
     question: str
     answer: str
+
+class ParsedPatientData(BaseModel):
+    patient_data: PatientData
+    unparsed_fields: Dict[str, str] = Field(default_factory=dict, description="Fields whose answer could not be interpreted, with the raw answer")
+    maybe_fields: List[str] = Field(default_factory=list, description="Yes/no fields answered with maybe or sometimes, stored as present")
+
+    @property
+    def complete(self) -> bool:
+        return not self.unparsed_fields
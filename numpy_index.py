@@ -0,0 +1,235 @@
+"""
+CKD NumPy Index Module
+
+This module provides a read-only, Chroma-free retrieval backend for the
+knowledge base: chunk embeddings exported into a memory-mapped matrix plus a
+compact metadata file, searched with vectorized dot products.
+
+Features:
+- Export of an existing vector store into embeddings.npy + chunks.json
+- float32, float16 or int8 (per-row scalar quantized) storage of
+  L2-normalized embeddings
+- Optional exact re-scoring of the top quantized candidates against a
+  full-precision copy that stays on disk
+- Memory-mapped loading, so worker processes share one page-cached matrix
+- Blocked cosine-similarity top-k search
+
+Many worker processes can open the same index with near-zero startup time,
+since nothing is read from the matrix until the first query touches it.
+"""
+
+import os
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILENAME = "embeddings.npy"
+SCALES_FILENAME = "scales.npy"
+FULL_PRECISION_FILENAME = "embeddings_f32.npy"
+CHUNKS_FILENAME = "chunks.json"
+INDEX_FORMAT_VERSION = 1
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+SEARCH_BLOCK_ROWS = 8192
+RESCORE_CANDIDATE_MULTIPLIER = 4
+
+def get_numpy_index_path(provider: str) -> str:
+    """Return the directory of the exported NumPy index for a provider"""
+    return f"./numpy_index_{provider}"
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization; returns the codes and row scales"""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    with open(f"{path}.tmp", "wb") as f:
+        np.save(f, array)
+
+def export_numpy_index(vector_store, index_dir: str, dtype: str = "float32", info: Optional[Dict[str, Any]] = None,
+                       keep_full_precision: bool = True) -> Dict[str, Any]:
+    """Export every chunk of a Chroma vector store into a NumPy index
+
+    Args:
+        vector_store: LangChain Chroma store to export
+        index_dir: Directory to write the index into
+        dtype: Storage type of the searched matrix ("float32", "float16" or "int8")
+        info: Extra fields recorded in the index metadata
+        keep_full_precision: For quantized dtypes, also write a float32 copy
+            that is used to re-score the top candidates exactly
+
+    Returns:
+        The index metadata that was written
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported index dtype: {dtype}. Use one of {', '.join(SUPPORTED_DTYPES)}")
+
+    existing = vector_store.get(include=["embeddings", "metadatas", "documents"])
+    full_matrix = _normalize_rows(np.asarray(existing["embeddings"], dtype=np.float32))
+    keep_full_precision = keep_full_precision and dtype != "float32"
+
+    os.makedirs(index_dir, exist_ok=True)
+    paths = {
+        "embeddings": os.path.join(index_dir, EMBEDDINGS_FILENAME),
+        "scales": os.path.join(index_dir, SCALES_FILENAME),
+        "full": os.path.join(index_dir, FULL_PRECISION_FILENAME),
+        "chunks": os.path.join(index_dir, CHUNKS_FILENAME)
+    }
+
+    metadata = {
+        "version": INDEX_FORMAT_VERSION,
+        "dtype": dtype,
+        "count": int(full_matrix.shape[0]),
+        "dim": int(full_matrix.shape[1]) if full_matrix.ndim == 2 else 0,
+        "full_precision": keep_full_precision,
+        **(info or {}),
+        "ids": existing["ids"],
+        "documents": existing["documents"],
+        "metadatas": existing["metadatas"]
+    }
+
+    # Write to temporary files first so readers never see a half-written index
+    written = ["embeddings", "chunks"]
+    if dtype == "int8":
+        codes, scales = quantize_int8(full_matrix)
+        _save_array(paths["embeddings"], codes)
+        _save_array(paths["scales"], scales)
+        written.append("scales")
+    else:
+        _save_array(paths["embeddings"], full_matrix.astype(dtype))
+    if keep_full_precision:
+        _save_array(paths["full"], full_matrix)
+        written.append("full")
+    with open(f"{paths['chunks']}.tmp", "w", encoding="utf-8") as f:
+        json.dump(metadata, f, separators=(",", ":"))
+
+    # Remove leftovers of a previous export with a different layout
+    for name in ("scales", "full"):
+        if name not in written and os.path.exists(paths[name]):
+            os.remove(paths[name])
+    for name in written:
+        os.replace(f"{paths[name]}.tmp", paths[name])
+
+    logger.info(f"Exported {metadata['count']} chunks ({dtype}, dim {metadata['dim']}) to {index_dir}")
+    return {key: value for key, value in metadata.items() if key not in ("ids", "documents", "metadatas")}
+
+class NumpyIndex:
+    """Read-only cosine-similarity index over a memory-mapped embedding matrix
+
+    Quantized indexes score every row with the compact matrix and, when a
+    full-precision copy was exported and rescore is enabled, re-rank the
+    best candidates exactly. Only the candidate rows of the float32 copy are
+    ever read, so it does not add to the resident memory of a process.
+    """
+
+    def __init__(self, index_dir: str, rescore: bool = True):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, CHUNKS_FILENAME), "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        if metadata.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported NumPy index version {metadata.get('version')} in {index_dir}")
+
+        self.info = {key: value for key, value in metadata.items() if key not in ("ids", "documents", "metadatas")}
+        self.ids: List[str] = metadata["ids"]
+        self.documents = [
+            Document(page_content=text or "", metadata=chunk_metadata or {})
+            for text, chunk_metadata in zip(metadata["documents"], metadata["metadatas"])
+        ]
+        self.matrix = np.load(os.path.join(index_dir, EMBEDDINGS_FILENAME), mmap_mode="r")
+        self.scales = None
+        if self.info.get("dtype") == "int8":
+            self.scales = np.load(os.path.join(index_dir, SCALES_FILENAME))
+        self.full_matrix = None
+        if rescore and self.info.get("full_precision"):
+            self.full_matrix = np.load(os.path.join(index_dir, FULL_PRECISION_FILENAME), mmap_mode="r")
+
+    def memory_footprint(self) -> int:
+        """Bytes of the matrices that every query scans"""
+        return int(self.matrix.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every row with a normalized query vector"""
+        scores = np.empty(self.matrix.shape[0], dtype=np.float32)
+        for start in range(0, self.matrix.shape[0], SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.matrix[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            block_scores = block @ query
+            if self.scales is not None:
+                block_scores *= self.scales[start:start + len(block)]
+            scores[start:start + len(block)] = block_scores
+        return scores
+
+    def search_by_vector(self, embedding: List[float], k: int) -> List[tuple]:
+        """Return up to k (row index, score) pairs, best first"""
+        if not len(self.documents):
+            return []
+        # Normalize a copy; the caller's embedding may be a cached query vector
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self._scores(query)
+        candidates = k * RESCORE_CANDIDATE_MULTIPLIER if self.full_matrix is not None else k
+        candidates = min(candidates, len(scores))
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+
+        if self.full_matrix is not None:
+            # Exact re-score of the candidates against the float32 copy
+            rows = np.sort(top)
+            scores = dict(zip(rows.tolist(), (np.asarray(self.full_matrix[rows]) @ query).tolist()))
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(int(row), float(score)) for row, score in best]
+
+        top = top[np.argsort(-scores[top])][:k]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def batch_search_by_vectors(self, embeddings: List[List[float]], k: int) -> List[List[tuple]]:
+        """Return the top-k (row index, score) pairs of many queries in one vectorized pass"""
+        if not len(self.documents) or not embeddings:
+            return [[] for _ in embeddings]
+        queries = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        # One (rows x queries) score matrix instead of one scan per query
+        scores = np.empty((self.matrix.shape[0], len(queries)), dtype=np.float32)
+        for start in range(0, self.matrix.shape[0], SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.matrix[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            block_scores = block @ queries.T
+            if self.scales is not None:
+                block_scores *= self.scales[start:start + len(block), None]
+            scores[start:start + len(block)] = block_scores
+
+        candidates = k * RESCORE_CANDIDATE_MULTIPLIER if self.full_matrix is not None else k
+        candidates = min(candidates, scores.shape[0])
+        top = np.argpartition(-scores, candidates - 1, axis=0)[:candidates]
+
+        results = []
+        for column in range(len(queries)):
+            rows = top[:, column]
+            if self.full_matrix is not None:
+                rows = np.sort(rows)
+                exact = np.asarray(self.full_matrix[rows]) @ queries[column]
+                order = np.argsort(-exact)[:k]
+                results.append([(int(rows[i]), float(exact[i])) for i in order])
+            else:
+                column_scores = scores[rows, column]
+                order = np.argsort(-column_scores)[:k]
+                results.append([(int(rows[i]), float(column_scores[i])) for i in order])
+        return results
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4) -> List[Document]:
+        """Return the k most similar chunks, matching the Chroma method of the same name"""
+        return [self.documents[row] for row, _ in self.search_by_vector(embedding, k)]
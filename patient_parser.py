@@ -0,0 +1,211 @@
+"""
+CKD Patient Response Parser Module
+
+This module turns collected questionnaire answers into a validated
+models.PatientData locally, without an LLM round trip.
+
+Features:
+- Question-to-field matching for every question in propmpts.questions_list
+  and the historical patient response files
+- Free-text answer parsing ("I'm 25 years old", "yes, sometimes", "F")
+- Fields that could not be parsed are flagged with their raw answer, and
+  "maybe"/"sometimes" answers to yes/no questions are recorded separately
+"""
+
+import os
+import re
+import logging
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple, get_args, get_origin
+
+from models import PatientData, ParsedPatientData
+
+logger = logging.getLogger(__name__)
+
+LOCAL_PARSE_ENABLED = os.getenv("CKD_LOCAL_PARSE", "true").lower() in ("1", "true", "yes")
+NO_ANSWER = "<no answer>"
+
+# Ordered (field, question pattern) pairs; the first match wins, so the
+# dialysis age question is matched before the current age question
+QUESTION_PATTERNS: List[Tuple[str, str]] = [
+    ("gender", r"gender"),
+    ("current_age_during_dialysis", r"dialysis"),
+    ("first_diagnosis_age", r"first diagnosed"),
+    ("report_obtained_date", r"medical report"),
+    ("age", r"current age|how old"),
+    ("hypertension", r"blood pressure|hypertension"),
+    ("diabetes_type_1", r"type 1 diabetes"),
+    ("diabetes_type_2", r"type 2 diabetes"),
+    ("cardiovascular_disease", r"cardiovascular"),
+    ("appetite_changes", r"appetite"),
+    ("pedal_edema", r"swelling|edema"),
+    ("hematuria", r"blood in your urine|hematuria"),
+    ("nocturia", r"nocturia|at night to urinate"),
+    ("flank_discomfort", r"flank|side or back"),
+    ("decreased_urine_output", r"urine output"),
+    ("fatigue", r"tired|fatigue"),
+    ("nausea_vomiting", r"nausea|vomiting"),
+    ("metallic_taste", r"metallic taste"),
+    ("unintended_weight_loss", r"lost weight|weight loss"),
+    ("itching", r"itching|pruritus"),
+    ("mental_state_changes", r"mental state"),
+    ("breathing_difficulty", r"breathing|breath")
+]
+
+# Answer patterns per choice of the Literal fields, tried in order
+CHOICE_PATTERNS: Dict[str, List[Tuple[str, str]]] = {
+    "gender": [
+        ("other", r"\b(other|non-?binary|diverse)\b"),
+        ("female", r"\b(female|woman|girl)\b|^\s*f\s*$"),
+        ("male", r"\b(male|man|boy)\b|^\s*m\s*$")
+    ],
+    "appetite_changes": [
+        ("unchanged", r"\b(unchanged|same|normal|no change|not changed)\b"),
+        ("increased", r"\b(increas\w*|more|higher|bigger|hungrier)\b"),
+        ("decreased", r"\b(decreas\w*|less|lost|loss|reduc\w*|poor|lower|no appetite)\b"),
+        ("unchanged", r"^(no|nope|none|not really|never)\b")
+    ],
+    "mental_state_changes": [
+        ("confusion", r"\b(confus\w*|disorient\w*)\b"),
+        ("memory_problems", r"\b(memory|forget\w*)\b"),
+        ("none", r"^(none|no|nope|normal|unchanged|fine|never|not really)\b")
+    ]
+}
+
+_MAYBE_ANSWER = re.compile(r"\b(maybe|sometimes|occasionally|not sure|unsure|possibly|at times|i think so|on and off"
+                           r"|don'?t know|do not know|no idea|not certain|can'?t say|cannot say|don'?t remember|do not remember)\b")
+_NEGATIVE_ANSWER = re.compile(r"^(no|nope|nah|never|none|not|n|false|i haven'?t|i have not|haven'?t"
+                              r"|(i )?(don'?t|do not)( (have|get|experience|feel|take|notice|smoke|drink|use|think so)\b|[\s.!]*$))")
+_POSITIVE_ANSWER = re.compile(r"^(yes|y|yeah|yep|yup|true|i do|i have|definitely|often|always|frequently|absolutely)\b")
+# Negation earlier in the same clause as a choice keyword, e.g. "it has not increased"
+_NEGATION = re.compile(r"\b(not|no|never|without|(has|have|is|was|did|does|do)n'?t)\b")
+_CLAUSE_BREAK = re.compile(r"[,.;!?]|\bbut\b")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_AGO = re.compile(r"(\d+(?:\.\d+)?)\s*(day|week|month|year)s?")
+
+def _field_sections() -> Dict[str, Tuple[str, Any]]:
+    """Map every PatientData leaf field to its section and annotation"""
+    sections = {}
+    for section, section_info in PatientData.model_fields.items():
+        for field, field_info in section_info.annotation.model_fields.items():
+            sections[field] = (section, field_info.annotation)
+    return sections
+
+FIELD_SECTIONS = _field_sections()
+
+def match_question_field(question: str) -> Optional[str]:
+    """Return the PatientData field a questionnaire question asks about, if any"""
+    question = question.lower()
+    for field, pattern in QUESTION_PATTERNS:
+        if re.search(pattern, question):
+            return field
+    return None
+
+def parse_yes_no(answer: str) -> Tuple[Optional[bool], bool]:
+    """Return (value, maybe) for a yes/no answer; value is None if not understood"""
+    answer = answer.strip().lower()
+    if _MAYBE_ANSWER.search(answer):
+        return True, True
+    if _NEGATIVE_ANSWER.match(answer):
+        return False, False
+    if _POSITIVE_ANSWER.match(answer):
+        return True, False
+    return None, False
+
+def _parse_int(answer: str) -> Optional[int]:
+    match = _NUMBER.search(answer)
+    if match is None:
+        return None
+    value = round(float(match.group()))
+    return value if 0 <= value <= 120 else None
+
+def _negated(answer: str, position: int) -> bool:
+    """Whether a negation precedes position within its clause"""
+    clause = _CLAUSE_BREAK.split(answer[:position])[-1]
+    return _NEGATION.search(clause) is not None
+
+def _parse_choice(field: str, answer: str) -> Optional[str]:
+    """Return the first choice whose keyword appears in the answer without a negation before it"""
+    for choice, pattern in CHOICE_PATTERNS.get(field, []):
+        for match in re.finditer(pattern, answer):
+            if not _negated(answer, match.start()):
+                return choice
+    return None
+
+def _parse_date(answer: str, today: Optional[date] = None) -> Optional[date]:
+    """Parse an ISO date, "N months ago", or a bare number of years ago"""
+    today = today or date.today()
+    try:
+        return date.fromisoformat(answer.strip())
+    except ValueError:
+        pass
+    match = _AGO.search(answer)
+    if match:
+        days = {"day": 1, "week": 7, "month": 30.44, "year": 365.25}[match.group(2)]
+        return today - timedelta(days=round(float(match.group(1)) * days))
+    match = _NUMBER.fullmatch(answer.strip())
+    if match:
+        return today - timedelta(days=round(float(match.group()) * 365.25))
+    return None
+
+def parse_answer(field: str, answer: Any) -> Tuple[Any, bool, bool]:
+    """Parse one answer for a PatientData field
+
+    Returns:
+        Tuple of (value, parsed, maybe); value is None when not parsed
+    """
+    if isinstance(answer, bool):
+        return answer, True, False
+    text = str(answer).strip().lower()
+    annotation = FIELD_SECTIONS[field][1]
+    kinds = [arg for arg in get_args(annotation) if arg is not type(None)]
+    kind = kinds[0] if kinds else annotation
+
+    if kind is bool:
+        value, maybe = parse_yes_no(text)
+        return value, value is not None, maybe
+    if kind is int:
+        value = _parse_int(text)
+    elif kind is date:
+        value = _parse_date(text)
+    elif get_origin(kind) is not None:
+        value = _parse_choice(field, text)
+    else:
+        value = None
+    return value, value is not None, False
+
+def parse_patient_responses(responses: List[Dict[str, Any]]) -> ParsedPatientData:
+    """Turn a list of {question, answer} dicts into a validated PatientData
+
+    Fields without a matching question stay None and are not flagged;
+    asked questions with empty or uninterpretable answers are.
+    """
+    sections: Dict[str, Dict[str, Any]] = {section: {} for section in PatientData.model_fields}
+    unparsed: Dict[str, str] = {}
+    maybe_fields: List[str] = []
+
+    for response in responses:
+        field = match_question_field(response.get("question", ""))
+        if field is None or field in sections[FIELD_SECTIONS[field][0]]:
+            continue
+        answer = response.get("answer")
+        if answer is None or not str(answer).strip():
+            unparsed[field] = NO_ANSWER
+            continue
+
+        value, parsed, maybe = parse_answer(field, answer)
+        if not parsed:
+            unparsed[field] = str(answer)
+            continue
+        sections[FIELD_SECTIONS[field][0]][field] = value
+        if maybe:
+            maybe_fields.append(field)
+
+    patient_data = PatientData(**sections)
+    if unparsed:
+        logger.debug(f"Parsed patient responses locally with {len(unparsed)} unparsed fields: {', '.join(unparsed)}")
+    return ParsedPatientData(patient_data=patient_data, unparsed_fields=unparsed, maybe_fields=maybe_fields)
+
+def get_field_value(patient_data: PatientData, field: str) -> Any:
+    """Return the value of a PatientData leaf field by name"""
+    return getattr(getattr(patient_data, FIELD_SECTIONS[field][0]), field)
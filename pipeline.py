@@ -0,0 +1,286 @@
+"""
+CKD Assessment Pipeline Profiles Module
+
+This module defines the agent task sequences the assessment crew can run
+and builds their tasks, for the Streamlit app and the testing scripts alike.
+
+Features:
+- Named pipeline profiles: "full" (QnA intake, diagnostic, research,
+  critique, presentation), "fast" (no QnA task, critique merged into the
+  presentation) and "minimal" (one research task that writes the report)
+- Internal "screening" profile used by the low-risk route of routing.py
+- Expected LLM call count per profile, one call per task; tool use by an
+  agent adds calls on top
+- The QnA intake task is dropped when the answers were parsed locally
+- Tasks are templates with patient placeholders; CrewTemplates builds a
+  crew once per LLM and task plan and hands out copies that are filled in
+  through crew.kickoff(inputs=crew_inputs(...))
+"""
+
+import os
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from crewai import Crew, Process, Task
+
+from models import ParsedPatientData
+
+logger = logging.getLogger(__name__)
+
+# Ordered task steps per profile
+PIPELINE_PROFILES: Dict[str, Dict[str, Any]] = {
+    "full": {
+        "description": "QnA intake, diagnostic, research, critique and presentation",
+        "steps": ["intake", "diagnostic", "research", "critique", "presentation"]
+    },
+    "fast": {
+        "description": "Diagnostic, research and a combined critique/presentation",
+        "steps": ["diagnostic", "research", "review_presentation"]
+    },
+    "minimal": {
+        "description": "A single research task that writes the patient report",
+        "steps": ["research_report"]
+    },
+    "screening": {
+        "description": "Low-risk screening research and presentation",
+        "steps": ["screening", "presentation"]
+    }
+}
+SELECTABLE_PROFILES = ["full", "fast", "minimal"]
+DEFAULT_PIPELINE_PROFILE = os.getenv("CKD_PIPELINE_PROFILE", "full")
+
+def resolve_steps(profile: str = DEFAULT_PIPELINE_PROFILE, parsed_complete: bool = False, route: str = "full") -> List[str]:
+    """Return the task steps a profile runs for one assessment
+
+    Args:
+        profile: Name of the pipeline profile
+        parsed_complete: Whether the answers were fully parsed locally, which
+            makes the QnA intake task unnecessary
+        route: Route chosen by routing.decide_route; the screening route
+            replaces the profile if it runs fewer tasks
+    """
+    if profile not in PIPELINE_PROFILES:
+        raise ValueError(f"Unknown pipeline profile: {profile}. Use one of {', '.join(SELECTABLE_PROFILES)}")
+    steps = [step for step in PIPELINE_PROFILES[profile]["steps"] if not (step == "intake" and parsed_complete)]
+    screening_steps = PIPELINE_PROFILES["screening"]["steps"]
+    if route == "screening" and len(screening_steps) < len(steps):
+        return list(screening_steps)
+    return steps
+
+def expected_llm_calls(profile: str = DEFAULT_PIPELINE_PROFILE, parsed_complete: bool = False, route: str = "full") -> int:
+    """Expected number of LLM calls of an assessment, one per task"""
+    return len(resolve_steps(profile, parsed_complete, route))
+
+def describe_profile(profile: str) -> str:
+    """Return a one-line description of a profile with its LLM call count"""
+    calls = expected_llm_calls(profile, parsed_complete=False)
+    parsed_calls = expected_llm_calls(profile, parsed_complete=True)
+    count = f"{calls}" if calls == parsed_calls else f"{parsed_calls}-{calls}"
+    return f"{profile}: {PIPELINE_PROFILES[profile]['description']} ({count} LLM calls)"
+
+def create_tasks(qna_agent, research_agent, diagnostic_agent, critique_agent, presentation_agent,
+                 parsed_complete: bool = False, route: str = "full", profile: str = DEFAULT_PIPELINE_PROFILE) -> List[Task]:
+    """Create the crew task templates of a pipeline profile
+
+    Patient data is left as {placeholders} that crew.kickoff fills in from
+    crew_inputs, so the tasks can be reused for every patient.
+
+    Args:
+        parsed_complete: Whether the answers were fully parsed locally; the
+            QnA intake task is then skipped and the structured data goes to
+            the diagnostic task
+        route: Route chosen by routing.decide_route
+        profile: Name of the pipeline profile
+
+    Returns:
+        Tasks in execution order
+    """
+    steps = resolve_steps(profile, parsed_complete, route)
+    tasks: List[Task] = []
+
+    for step in steps:
+        if step == "intake":
+            task = Task(
+                description="""
+                Process the following patient responses collected from the questionnaire:
+
+                {current_patient_responses}
+
+                Your task is to:
+                1. Review and validate the collected patient responses
+                2. Organize the information in a structured format
+                3. Identify any missing or unclear responses that might need clarification
+                4. Format the data for analysis by other agents
+
+                Focus on ensuring data quality and completeness for CKD risk assessment.
+                """,
+                agent=qna_agent,
+                expected_output="Structured and validated patient questionnaire responses in JSON format"
+            )
+        elif step == "diagnostic":
+            if parsed_complete:
+                patient_section = """
+                Structured patient data parsed from the questionnaire (fields answered with maybe/sometimes: {maybe_fields}):
+
+                {structured_patient_data}
+                """
+            elif tasks:
+                patient_section = ""
+            else:
+                patient_section = """
+                Patient questionnaire responses:
+
+                {current_patient_responses}
+                """
+            task = Task(
+                description=f"""
+                Analyze the patient's responses and any diagnostic images to assess potential kidney issues.
+                {patient_section}""",
+                agent=diagnostic_agent,
+                dependencies=tasks[-1:],
+                expected_output="Diagnostic analysis of patient data and images"
+            )
+        elif step == "research":
+            task = Task(
+                description="""
+                Conduct a comprehensive CKD risk assessment using:
+                1. Patient questionnaire responses from the QnA agent
+                2. Diagnostic analysis from the diagnostic agent
+                3. Historical patient data patterns
+                4. KDIGO guidelines and medical knowledge
+
+                Provide detailed factor analysis with:
+                - Individual risk percentage for each factor
+                - Evidence-based explanations
+                - Overall risk calculation
+                - Top 3 most concerning factors
+                """,
+                agent=research_agent,
+                dependencies=list(tasks),
+                expected_output="Comprehensive CKD risk assessment with detailed factor analysis and percentage contributions"
+            )
+        elif step == "research_report":
+            task = Task(
+                description="""
+                Conduct a CKD risk assessment and present it directly to the patient, using:
+                1. The patient questionnaire responses:
+
+                {current_patient_responses}
+
+                2. The local risk pre-score, guideline passages and historical patient data in your context
+
+                Give the overall risk, the contribution of each reported factor with evidence-based
+                explanations and the top 3 most concerning factors, written as a clear, concise and
+                user-friendly report.
+                """,
+                agent=research_agent,
+                expected_output="User-friendly CKD assessment report with factor analysis"
+            )
+        elif step == "screening":
+            task = Task(
+                description="""
+                Conduct a CKD risk screening for a patient whose answers and local risk pre-score indicate a clear low-risk case, using:
+                1. The patient questionnaire responses:
+
+                {current_patient_responses}
+
+                2. The local risk pre-score and guideline passages in your context
+
+                Confirm or correct the low risk, explain the pre-score and list any factors worth monitoring.
+                """,
+                agent=research_agent,
+                expected_output="CKD risk screening with the explained pre-score and factors to monitor"
+            )
+        elif step == "critique":
+            task = Task(
+                description="Review and critique the CKD risk assessment for accuracy and completeness",
+                agent=critique_agent,
+                dependencies=tasks[-1:],
+                expected_output="Final verified CKD assessment with critique and corrections"
+            )
+        elif step == "review_presentation":
+            task = Task(
+                description="""
+                Review the CKD risk assessment for accuracy and completeness, correct any errors or
+                unsupported percentages, and present the verified result as a clear, user-friendly report.
+                """,
+                agent=presentation_agent,
+                dependencies=tasks[-1:],
+                expected_output="Verified, user-friendly CKD assessment report"
+            )
+        elif step == "presentation":
+            task = Task(
+                description="Create a clear, user-friendly presentation of the CKD assessment results",
+                agent=presentation_agent,
+                dependencies=tasks[-1:],
+                expected_output="User-friendly CKD assessment report"
+            )
+        else:
+            raise ValueError(f"Unknown pipeline step: {step}")
+        tasks.append(task)
+
+    logger.info(f"Pipeline profile {profile} (route {route}): {', '.join(steps)}")
+    return tasks
+
+def crew_inputs(collected_patient_data: str, parsed_patient: Optional[ParsedPatientData] = None,
+                **agent_inputs: str) -> Dict[str, str]:
+    """Return the per-patient kickoff inputs of a crew built from create_tasks
+
+    Args:
+        collected_patient_data: Collected questionnaire answers as JSON
+        parsed_patient: Locally parsed answers
+        agent_inputs: Further placeholders of the agent prompts, e.g. the
+            research agent's guideline passages and risk pre-score
+    """
+    inputs = {
+        "current_patient_responses": collected_patient_data,
+        "structured_patient_data": parsed_patient.patient_data.model_dump_json(indent=2) if parsed_patient else "",
+        "maybe_fields": (", ".join(parsed_patient.maybe_fields) if parsed_patient else "") or "none"
+    }
+    inputs.update(agent_inputs)
+    return inputs
+
+class CrewTemplates:
+    """Crews built once per template key and task plan, copied for every run
+
+    Building the agents formats their prompts and instantiates their tools;
+    a template pays that once, and each run gets its own copy so concurrent
+    runs do not share task state.
+    """
+
+    def __init__(self):
+        self._templates: Dict[Tuple, Crew] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.reuses = 0
+
+    def get(self, key: Tuple, build_agents: Callable[[], Tuple], parsed_complete: bool = False,
+            route: str = "full", profile: str = DEFAULT_PIPELINE_PROFILE, **crew_options) -> Crew:
+        """Return a fresh copy of the crew for a template key and task plan
+
+        Args:
+            key: Identifies the agents and crew options, e.g. (provider, model)
+            build_agents: Returns the five agents when the template is built
+            crew_options: Further Crew arguments (verbose, memory, embedder)
+        """
+        plan = (key, profile, parsed_complete, route)
+        with self._lock:
+            template = self._templates.get(plan)
+            if template is None:
+                tasks = create_tasks(*build_agents(), parsed_complete, route, profile)
+                template = Crew(
+                    agents=list(dict.fromkeys(task.agent for task in tasks)),
+                    tasks=tasks,
+                    process=Process.sequential,
+                    **crew_options
+                )
+                self._templates[plan] = template
+                self.builds += 1
+                logger.info(f"Built crew template for {key} with profile {profile} (route {route})")
+            else:
+                self.reuses += 1
+        return template.copy()
+
+# Process-wide templates; kept here rather than in main.py, which Streamlit re-executes on every rerun
+crew_templates = CrewTemplates()
@@ -0,0 +1,91 @@
+"""
+CKD Query Cache Module
+
+This module provides bounded in-memory caches for the medical knowledge
+search path: query embeddings and formatted retrieval results.
+
+Features:
+- Thread-safe LRU eviction with a per-entry time-to-live
+- Hit/miss/eviction counters for monitoring
+- Query normalization so re-cased or re-spaced queries share an entry
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+QUERY_CACHE_SIZE = int(os.getenv("CKD_QUERY_CACHE_SIZE", "512"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("CKD_QUERY_CACHE_TTL", "3600"))
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query into a cache key
+
+    Queries are lower-cased and their whitespace collapsed, so
+    "CKD  risk" and "ckd risk" share a key; word order and operators are
+    kept, as "eGFR < 60" and "eGFR > 60" ask different things.
+    """
+    return " ".join(query.lower().split())
+
+class LRUCache:
+    """Bounded least-recently-used cache with optional time-to-live"""
+
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE, ttl_seconds: Optional[float] = QUERY_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for a key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entries if full"""
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate=None) -> int:
+        """Drop every entry, or only those whose key matches the predicate"""
+        with self._lock:
+            if predicate is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [key for key in self._entries if predicate(key)]
+                for key in keys:
+                    del self._entries[key]
+                removed = len(keys)
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
@@ -0,0 +1,125 @@
+"""
+CKD Retrieval Post-processing Module
+
+This module shapes retrieved knowledge base chunks before they are sent to
+an LLM, to keep retrieval prompt tokens low.
+
+Features:
+- Near-duplicate chunk suppression using word shingles and Jaccard similarity
+- Token counting with tiktoken and trimming to a configurable token budget
+- Compact source labels (file name and page instead of full paths)
+"""
+
+import os
+import re
+import logging
+from typing import Any, Dict, FrozenSet, List, Optional
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("CKD_RETRIEVAL_TOKEN_BUDGET", "1200"))
+BATCH_RETRIEVAL_TOKEN_BUDGET = int(os.getenv("CKD_BATCH_RETRIEVAL_TOKEN_BUDGET", "3000"))
+DUPLICATE_SIMILARITY_THRESHOLD = float(os.getenv("CKD_DUPLICATE_THRESHOLD", "0.6"))
+SHINGLE_SIZE = 5
+TOKEN_ENCODING = "cl100k_base"
+TRUNCATION_MARKER = " [...]"
+MIN_TRUNCATED_TOKENS = 40
+
+_WORD_PATTERN = re.compile(r"\w+")
+_encoding = None
+
+def _get_encoding():
+    """Return the tiktoken encoding, or None if it cannot be loaded"""
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception as e:
+            logger.warning(f"Could not load tiktoken encoding {TOKEN_ENCODING}, estimating tokens from length: {str(e)}")
+            _encoding = False
+    return _encoding or None
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a text"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut a text down to at most max_tokens tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+def _shingles(text: str, size: int = SHINGLE_SIZE) -> FrozenSet[str]:
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+def _jaccard(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+def find_near_duplicate(text: str, kept_texts: List[str], threshold: float = DUPLICATE_SIMILARITY_THRESHOLD) -> Optional[int]:
+    """Return the index of the first kept text that the text nearly duplicates"""
+    shingles = _shingles(text)
+    for i, kept in enumerate(kept_texts):
+        if _jaccard(shingles, _shingles(kept)) >= threshold:
+            return i
+    return None
+
+def suppress_near_duplicates(documents: List[Any], k: Optional[int] = None,
+                             threshold: float = DUPLICATE_SIMILARITY_THRESHOLD) -> List[Any]:
+    """Drop chunks that nearly duplicate a higher-ranked chunk, keeping at most k"""
+    kept = []
+    kept_shingles = []
+    for doc in documents:
+        shingles = _shingles(doc.page_content)
+        if any(_jaccard(shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+        if k is not None and len(kept) >= k:
+            break
+
+    if len(kept) < len(documents) and (k is None or len(kept) < k):
+        logger.info(f"Suppressed {len(documents) - len(kept)} near-duplicate chunks")
+    return kept
+
+def compact_source_label(metadata: Dict[str, Any]) -> str:
+    """Return a short source label such as "KDIGO-2024-...-PCPs-Evaluation p3" """
+    source = metadata.get("source", "Unknown source")
+    label = os.path.splitext(os.path.basename(source))[0]
+    page = metadata.get("page")
+    if isinstance(page, int):
+        label += f" p{page + 1}"
+    return label
+
+def fit_to_token_budget(sections: List[str], budget: int = RETRIEVAL_TOKEN_BUDGET, separator: str = "\n\n") -> List[str]:
+    """Keep sections in order until the token budget is spent, truncating the last one"""
+    fitted = []
+    remaining = budget
+    separator_tokens = count_tokens(separator)
+    for section in sections:
+        cost = count_tokens(section) + (separator_tokens if fitted else 0)
+        if cost <= remaining:
+            fitted.append(section)
+            remaining -= cost
+            continue
+        room = remaining - (separator_tokens if fitted else 0) - count_tokens(TRUNCATION_MARKER)
+        if room >= MIN_TRUNCATED_TOKENS:
+            fitted.append(truncate_to_tokens(section, room).rstrip() + TRUNCATION_MARKER)
+        logger.info(f"Trimmed retrieval output to a budget of {budget} tokens ({len(sections) - len(fitted)} sections dropped)")
+        break
+    return fitted
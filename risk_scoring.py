@@ -0,0 +1,304 @@
+"""
+CKD Risk Scoring Module
+
+This module provides a deterministic, vectorized CKD risk pre-score over
+models.PatientData, so the research agent explains a computed score
+instead of inventing one.
+
+Features:
+- Fixed feature vector per patient (age, conditions, symptoms; "maybe"
+  answers count half)
+- Logistic model whose weights are fitted with NumPy ridge regression
+  towards clinical prior weights, calibrated on the historical patient
+  responses and the scenario risk levels
+- Batch scoring of any number of patients with one matrix product
+- Per-factor contributions that add up to the score above the baseline
+
+Usage:
+    python risk_scoring.py
+"""
+
+import os
+import csv
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models import ParsedPatientData, PatientData
+from patient_parser import parse_patient_responses, parse_yes_no, get_field_value
+
+logger = logging.getLogger(__name__)
+
+PAST_RESPONSES_PATH = "data/past_patient_responses.json"
+PRESENT_RESPONSES_PATH = "data/present_patient_responses.json"
+SCENARIOS_PATH = "scenarios/ckd_scenarios.csv"
+
+# (feature, display name, clinical prior weight in log-odds)
+FEATURES: List[Tuple[str, str, float]] = [
+    ("age", "Age over 40 (per decade)", 0.6),
+    ("hypertension", "Hypertension", 0.9),
+    ("diabetes_type_1", "Type 1 diabetes", 0.9),
+    ("diabetes_type_2", "Type 2 diabetes", 0.9),
+    ("cardiovascular_disease", "Cardiovascular disease", 0.7),
+    ("appetite_changes", "Appetite changes", 0.2),
+    ("pedal_edema", "Pedal edema", 0.5),
+    ("hematuria", "Hematuria", 0.5),
+    ("nocturia", "Nocturia", 0.3),
+    ("flank_discomfort", "Flank discomfort", 0.2),
+    ("decreased_urine_output", "Decreased urine output", 0.5),
+    ("fatigue", "Fatigue", 0.3),
+    ("nausea_vomiting", "Nausea or vomiting", 0.3),
+    ("metallic_taste", "Metallic taste", 0.3),
+    ("unintended_weight_loss", "Unintended weight loss", 0.2),
+    ("itching", "Itching", 0.3),
+    ("mental_state_changes", "Mental state changes", 0.2),
+    ("breathing_difficulty", "Breathing difficulty", 0.3)
+]
+FEATURE_NAMES = [feature for feature, _, _ in FEATURES]
+PRIOR_BIAS = -3.0
+AGE_ONSET = 40
+MAYBE_WEIGHT = 0.5
+
+# Calibration targets: scenario risk levels and the cohort, all of whom
+# developed CKD within one year of their past responses
+LEVEL_TARGETS = {"None": 0.05, "Low": 0.15, "Medium": 0.40, "High": 0.80}
+PAST_COHORT_TARGET = 0.70
+PRESENT_COHORT_TARGET = 0.85
+SCENARIO_WEIGHT = 3.0
+COHORT_WEIGHT = 0.25
+RIDGE_LAMBDA = 1.0
+
+# Same bands as the presentation agent's report
+RISK_LEVELS = [(25.0, "Low"), (60.0, "Moderate"), (100.0, "High")]
+
+def _logit(p: np.ndarray) -> np.ndarray:
+    return np.log(p / (1 - p))
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+def _age_feature(age: Optional[int]) -> float:
+    return max(0.0, (age or 0) - AGE_ONSET) / 10.0
+
+def featurize(parsed: ParsedPatientData) -> np.ndarray:
+    """Return the feature vector of a parsed patient; unknown fields count as absent
+
+    A plain yes/maybe to a question whose choices are directions (e.g.
+    appetite changes) counts as present/maybe instead of unknown.
+    """
+    patient_data = parsed.patient_data
+    vector = np.zeros(len(FEATURES), dtype=np.float64)
+    for i, feature in enumerate(FEATURE_NAMES):
+        if feature == "age":
+            vector[i] = _age_feature(patient_data.demographics.age)
+            continue
+        value = get_field_value(patient_data, feature)
+        maybe = feature in parsed.maybe_fields
+        if isinstance(value, str):
+            present = value not in ("unchanged", "none")
+        elif value is None and feature in parsed.unparsed_fields:
+            present, maybe = parse_yes_no(parsed.unparsed_fields[feature])
+        else:
+            present = value is True
+        if present:
+            vector[i] = MAYBE_WEIGHT if maybe else 1.0
+    return vector
+
+def featurize_many(patients: Sequence[Any]) -> np.ndarray:
+    """Return the (patients x features) matrix of ParsedPatientData, PatientData or response lists"""
+    rows = []
+    for patient in patients:
+        if isinstance(patient, PatientData):
+            patient = ParsedPatientData(patient_data=patient)
+        elif not isinstance(patient, ParsedPatientData):
+            patient = parse_patient_responses(patient)
+        rows.append(featurize(patient))
+    return np.vstack(rows) if rows else np.zeros((0, len(FEATURES)))
+
+def _scenario_rows(path: str) -> Tuple[List[np.ndarray], List[float]]:
+    """Feature vectors and targets of the labelled scenarios"""
+    columns = {"t1d": "diabetes_type_1", "t2d": "diabetes_type_2", "hypertension": "hypertension",
+               "cardiovascular": "cardiovascular_disease", "fatigue": "fatigue", "pedal_edema": "pedal_edema"}
+    rows, targets = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["risk_level"] not in LEVEL_TARGETS:
+                continue
+            vector = np.zeros(len(FEATURES), dtype=np.float64)
+            vector[FEATURE_NAMES.index("age")] = _age_feature(int(row["age"]))
+            for column, feature in columns.items():
+                vector[FEATURE_NAMES.index(feature)] = 1.0 if row[column].strip().upper() == "Y" else 0.0
+            rows.append(vector)
+            targets.append(LEVEL_TARGETS[row["risk_level"]])
+    return rows, targets
+
+def _cohort_rows(path: str) -> List[np.ndarray]:
+    with open(path, "r", encoding="utf-8") as f:
+        patients = json.load(f)
+    return list(featurize_many([patient["responses"] for patient in patients]))
+
+class RiskModel:
+    """Logistic CKD risk model over the FEATURES vector"""
+
+    def __init__(self, weights: np.ndarray, bias: float, calibration: Optional[Dict[str, Any]] = None):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.calibration = calibration or {}
+
+    @classmethod
+    def prior(cls) -> "RiskModel":
+        """Model with the clinical prior weights only"""
+        return cls(np.array([weight for _, _, weight in FEATURES]), PRIOR_BIAS, {"source": "prior"})
+
+    @classmethod
+    def calibrate(cls, past_path: str = PAST_RESPONSES_PATH, present_path: str = PRESENT_RESPONSES_PATH,
+                  scenarios_path: str = SCENARIOS_PATH) -> "RiskModel":
+        """Fit the weights on the scenario levels and the CKD cohort
+
+        Weighted ridge regression of the target log-odds, shrunk towards the
+        prior weights; negative weights are clipped, since every feature is
+        a risk factor.
+        """
+        rows, targets, sample_weights = [], [], []
+        counts = {}
+        for path, loader, target, weight in (
+            (scenarios_path, "scenarios", None, SCENARIO_WEIGHT),
+            (past_path, "cohort", PAST_COHORT_TARGET, COHORT_WEIGHT),
+            (present_path, "cohort", PRESENT_COHORT_TARGET, COHORT_WEIGHT)
+        ):
+            if not os.path.exists(path):
+                logger.warning(f"Calibration data not found, skipping: {path}")
+                continue
+            if loader == "scenarios":
+                new_rows, new_targets = _scenario_rows(path)
+            else:
+                new_rows = _cohort_rows(path)
+                new_targets = [target] * len(new_rows)
+            rows.extend(new_rows)
+            targets.extend(new_targets)
+            sample_weights.extend([weight] * len(new_rows))
+            counts[path] = len(new_rows)
+
+        if not rows:
+            logger.warning("No calibration data available - using prior risk weights")
+            return cls.prior()
+
+        # Intercept as an extra column, shrunk towards the prior bias as well
+        X = np.hstack([np.vstack(rows), np.ones((len(rows), 1))])
+        y = _logit(np.asarray(targets))
+        W = np.asarray(sample_weights)
+        prior = np.array([weight for _, _, weight in FEATURES] + [PRIOR_BIAS])
+        A = X.T @ (X * W[:, None]) + RIDGE_LAMBDA * np.eye(X.shape[1])
+        b = X.T @ (W * y) + RIDGE_LAMBDA * prior
+        solution = np.linalg.solve(A, b)
+        weights = np.clip(solution[:-1], 0.0, None)
+
+        model = cls(weights, solution[-1], {"source": "calibrated", "rows": counts})
+        predictions = model.score_matrix(X[:, :-1])[0]
+        model.calibration["mean_abs_error"] = round(float(np.average(np.abs(predictions - np.asarray(targets)), weights=W)), 4)
+        logger.info(f"Calibrated CKD risk model on {len(rows)} rows (weighted MAE {model.calibration['mean_abs_error']})")
+        return model
+
+    def score_matrix(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Score a (patients x features) matrix
+
+        Returns:
+            Overall risk probabilities (patients,) and per-factor
+            contributions (patients x features) that add up to the risk
+            above the baseline
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        terms = X * self.weights
+        logits = terms.sum(axis=1)
+        scores = _sigmoid(self.bias + logits)
+        baseline = _sigmoid(np.float64(self.bias))
+        shares = np.divide(terms, logits[:, None], out=np.zeros_like(terms), where=logits[:, None] > 0)
+        return scores, shares * (scores - baseline)[:, None]
+
+    def score_batch(self, patients: Sequence[Any]) -> List[Dict[str, Any]]:
+        """Score many patients in one vectorized call"""
+        scores, contributions = self.score_matrix(featurize_many(patients))
+        return [self._result(score, row) for score, row in zip(scores, contributions)]
+
+    def score(self, patient: Any) -> Dict[str, Any]:
+        """Score one patient (ParsedPatientData, PatientData or a response list)"""
+        return self.score_batch([patient])[0]
+
+    def _result(self, score: float, contributions: np.ndarray) -> Dict[str, Any]:
+        risk_percent = round(float(score) * 100, 1)
+        factors = [
+            {"factor": feature, "name": name, "contribution_percent": round(float(value) * 100, 1)}
+            for (feature, name, _), value in zip(FEATURES, contributions)
+            if value > 0
+        ]
+        factors.sort(key=lambda factor: factor["contribution_percent"], reverse=True)
+        return {
+            "risk_percent": risk_percent,
+            "risk_level": risk_level(risk_percent),
+            "baseline_percent": round(float(_sigmoid(np.float64(self.bias))) * 100, 1),
+            "factors": factors
+        }
+
+def risk_level(risk_percent: float) -> str:
+    """Map a risk percentage to the report's Low/Moderate/High bands"""
+    for upper, level in RISK_LEVELS:
+        if risk_percent < upper:
+            return level
+    return RISK_LEVELS[-1][1]
+
+_model: Optional[RiskModel] = None
+_model_lock = threading.Lock()
+
+def get_risk_model() -> RiskModel:
+    """Return the process-wide calibrated risk model"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            try:
+                _model = RiskModel.calibrate()
+            except Exception as e:
+                logger.error(f"Risk model calibration failed, using prior weights: {str(e)}")
+                _model = RiskModel.prior()
+        return _model
+
+def format_risk_score(result: Dict[str, Any]) -> str:
+    """Format a score for the research agent's context"""
+    lines = [
+        f"Overall pre-score: {result['risk_percent']}% ({result['risk_level']} risk; baseline {result['baseline_percent']}% with no risk factors)",
+        "Factor contributions (percentage points above baseline):"
+    ]
+    lines.extend(f"- {factor['name']}: {factor['contribution_percent']}%" for factor in result["factors"])
+    if not result["factors"]:
+        lines.append("- none")
+    return "\n".join(lines)
+
+def main():
+    """Calibrate the model and print its weights and level separation"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    try:
+        model = get_risk_model()
+        print(f"Calibration: {model.calibration}")
+        print(f"Bias: {model.bias:.3f}")
+        for (feature, _, prior), weight in zip(FEATURES, model.weights):
+            print(f"{feature:<26} {weight:6.3f} (prior {prior})")
+
+        if os.path.exists(SCENARIOS_PATH):
+            rows, targets = _scenario_rows(SCENARIOS_PATH)
+            scores = model.score_matrix(np.vstack(rows))[0] * 100
+            for level, target in LEVEL_TARGETS.items():
+                mask = np.asarray(targets) == target
+                print(f"Scenario level {level:<7} mean score {scores[mask].mean():5.1f}%")
+        return 0
+    except Exception as e:
+        logger.error(f"Risk model calibration failed: {e}")
+        return 1
+
+if __name__ == "__main__":
+    exit(main())
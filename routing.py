@@ -0,0 +1,73 @@
+"""
+CKD Pipeline Routing Module
+
+This module decides, before the crew is built, whether an assessment needs
+the full agent pipeline or can take a shortened path.
+
+Features:
+- Rule on the locally parsed answers and the risk pre-score: complete
+  answers, a score at or below a threshold and at most a given number of
+  positive risk factors take the screening route
+- Screening route runs the research and presentation agents only
+- Thresholds configurable through environment variables
+- Every decision carries the route, the reason and the inputs it used, so
+  it can be recorded with the assessment result
+"""
+
+import os
+import logging
+from typing import Any, Dict, Optional
+
+from models import ParsedPatientData
+from risk_scoring import get_risk_model, featurize, FEATURE_NAMES
+
+logger = logging.getLogger(__name__)
+
+ROUTING_ENABLED = os.getenv("CKD_ROUTING", "true").lower() in ("1", "true", "yes")
+LOW_RISK_THRESHOLD = float(os.getenv("CKD_ROUTE_LOW_RISK_THRESHOLD", "15"))
+MAX_SCREENING_FACTORS = int(os.getenv("CKD_ROUTE_MAX_FACTORS", "0"))
+
+ROUTES = {
+    "full": "QnA/diagnostic intake, research, critique and presentation",
+    "screening": "research and presentation only"
+}
+
+def decide_route(parsed: ParsedPatientData, score: Optional[Dict[str, Any]] = None,
+                 has_diagnostic_image: bool = False, enabled: Optional[bool] = None) -> Dict[str, Any]:
+    """Choose the pipeline route for a patient
+
+    Args:
+        parsed: Locally parsed questionnaire answers
+        score: Risk pre-score of the patient; computed if not given
+        has_diagnostic_image: An uploaded image always needs the diagnostic agent
+        enabled: Override of CKD_ROUTING
+
+    Returns:
+        Dict with the route, a human-readable reason, the pre-score and the
+        number of positive risk factors
+    """
+    score = score or get_risk_model().score(parsed)
+    positive_factors = [feature for feature, value in zip(FEATURE_NAMES, featurize(parsed)) if value > 0 and feature != "age"]
+    decision = {
+        "route": "full",
+        "risk_percent": score["risk_percent"],
+        "positive_factors": len(positive_factors),
+        "threshold_percent": LOW_RISK_THRESHOLD
+    }
+
+    if not (ROUTING_ENABLED if enabled is None else enabled):
+        decision["reason"] = "routing disabled"
+    elif has_diagnostic_image:
+        decision["reason"] = "diagnostic image provided"
+    elif not parsed.complete:
+        decision["reason"] = f"answers not fully parsed ({', '.join(parsed.unparsed_fields)})"
+    elif score["risk_percent"] > LOW_RISK_THRESHOLD:
+        decision["reason"] = f"pre-score {score['risk_percent']}% above {LOW_RISK_THRESHOLD}%"
+    elif len(positive_factors) > MAX_SCREENING_FACTORS:
+        decision["reason"] = f"{len(positive_factors)} risk factors present (screening allows {MAX_SCREENING_FACTORS})"
+    else:
+        decision["route"] = "screening"
+        decision["reason"] = f"clear low-risk case: pre-score {score['risk_percent']}%, {len(positive_factors)} risk factors"
+
+    logger.info(f"Routing assessment to the {decision['route']} pipeline: {decision['reason']}")
+    return decision
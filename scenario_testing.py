@@ -7,6 +7,7 @@ Each simulation maintains core scenario parameters while varying other responses
 
 Usage:
     python scenario_testing.py --llm_provider groq --model llama --num_simulations 5
+    python scenario_testing.py --num_simulations 5 --workers 8 --max_in_flight 6
 """
 
 import os
@@ -16,6 +17,7 @@ import argparse
 import logging
 import pandas as pd
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 from typing import List, Dict, Any, Tuple
 import time
@@ -26,8 +28,13 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from dotenv import load_dotenv
 from scripts import (
     CKDTestScenarioGenerator, CKDAgentWorkflowTester,
-    ResultsExporter, SimulationResultsAggregator
+    ResultsExporter, SimulationResultsAggregator, run_simulation, iter_simulations
 )
+from patient_parser import LOCAL_PARSE_ENABLED
+from routing import ROUTING_ENABLED
+from pipeline import SELECTABLE_PROFILES, DEFAULT_PIPELINE_PROFILE
+from llm_cache import get_llm_cache, LLM_CACHE_MODES, LLM_CACHE_MODE
+from llm_scheduler import get_llm_scheduler, LLM_MAX_IN_FLIGHT
 
 # Load environment variables
 load_dotenv()
@@ -281,6 +288,18 @@ def parse_args():
                        help='Directory to save results')
     parser.add_argument('--scenarios_file', type=str, default='scenarios/ckd_scenarios.csv',
                        help='Path to scenarios CSV file')
+    parser.add_argument('--no_local_parse', action='store_true', default=not LOCAL_PARSE_ENABLED,
+                       help='Always run the QnA agent task instead of parsing answers locally (default from CKD_LOCAL_PARSE)')
+    parser.add_argument('--no_routing', action='store_true', default=not ROUTING_ENABLED,
+                       help='Always run the full agent pipeline, even for clear low-risk cases (default from CKD_ROUTING)')
+    parser.add_argument('--profile', choices=SELECTABLE_PROFILES, default=DEFAULT_PIPELINE_PROFILE,
+                       help='Pipeline profile of the assessment crew')
+    parser.add_argument('--llm_cache', choices=LLM_CACHE_MODES, default=LLM_CACHE_MODE,
+                       help='LLM response cache mode')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Number of simulations to run concurrently across all scenarios')
+    parser.add_argument('--max_in_flight', type=int, default=LLM_MAX_IN_FLIGHT,
+                       help='Maximum number of concurrent LLM requests across all workers')
     
     return parser.parse_args()
 
@@ -297,52 +316,37 @@ def main():
         
         # Initialize components
         scenario_manager = ScenarioManager(args.scenarios_file)
-        generator = CKDTestScenarioGenerator(args.llm_provider, args.model)
-        tester = CKDAgentWorkflowTester(args.llm_provider, args.model)
-        exporter = ResultsExporter(str(output_dir))
+        generator = CKDTestScenarioGenerator(args.llm_provider, args.model, args.llm_cache)
+        tester = CKDAgentWorkflowTester(args.llm_provider, args.model, local_parse=not args.no_local_parse, routing=not args.no_routing,
+                                        profile=args.profile, llm_cache_mode=args.llm_cache)
         aggregator = ScenarioResultsAggregator(str(output_dir))
+        get_llm_scheduler().set_max_in_flight(args.max_in_flight)
         
-        # Process each scenario
+        # One job per scenario and simulation, each scenario exporting to its own directory
+        scenarios = []
+        jobs = []
         for idx, row in scenario_manager.scenarios_df.iterrows():
             scenario_params = scenario_manager.get_scenario_params(row)
-            logger.info(f"Processing scenario {idx + 1}: {scenario_params['scenario_desc']}")
-            
-            # Create scenario-specific directory
             scenario_dir = output_dir / f"scenario_{idx + 1}"
             scenario_dir.mkdir(exist_ok=True)
-            
-            # Update exporter and aggregator for this scenario
-            exporter.output_dir = scenario_dir
+            exporter = ResultsExporter(str(scenario_dir))
+            scenarios.append((idx, scenario_params, scenario_dir))
+            jobs.extend(
+                partial(run_simulation, generator, tester, exporter, scenario_params['scenario_desc'], sim_num,
+                        metadata=scenario_params)
+                for sim_num in range(1, args.num_simulations + 1)
+            )
+        
+        # Results come back in scenario and simulation order; with one worker the
+        # simulations of a scenario only run when its results are consumed below
+        results = iter_simulations(jobs, args.workers)
+        
+        # Consolidate each scenario as soon as its simulations are done
+        for idx, scenario_params, scenario_dir in scenarios:
+            logger.info(f"Processing scenario {idx + 1}: {scenario_params['scenario_desc']}")
+            all_assessment_results = [next(results) for _ in range(args.num_simulations)]
             aggregator.output_dir = scenario_dir
             
-            # Store all assessment results for this scenario
-            all_assessment_results = []
-            
-            # Run multiple simulations
-            for sim_num in range(args.num_simulations):
-                logger.info(f"Running simulation {sim_num + 1}/{args.num_simulations}")
-                
-                # Generate responses
-                logger.info("Generating patient responses...")
-                qna_data = generator.generate_responses(scenario_params['scenario_desc'])
-                
-                # Run assessment
-                logger.info("Running CKD assessment...")
-                assessment_result = tester.run_assessment(qna_data)
-                
-                # Add simulation number and scenario metadata
-                assessment_result['simulation_number'] = sim_num + 1
-                assessment_result.update(scenario_params)
-                
-                # Export individual results
-                logger.info("Exporting results...")
-                output_file = exporter.export_assessment(assessment_result)
-                
-                # Store result for aggregation
-                all_assessment_results.append(assessment_result)
-                
-                logger.info(f"Simulation {sim_num + 1} completed. Results saved to: {output_file}")
-            
             # Generate consolidated reports
             logger.info("Generating consolidated reports...")
             csv_files = aggregator.aggregate_results(all_assessment_results, scenario_params)
@@ -353,6 +357,9 @@ def main():
             aggregator._analyze_scenario_results(scenario_params, all_assessment_results)
             logger.info("Analysis completed and exported")
         
+        logger.info(f"LLM response cache: {get_llm_cache().stats()}")
+        logger.info(f"Crew templates: {tester.crew_templates.builds} built, {tester.crew_templates.reuses} reused")
+        logger.info(f"LLM scheduler: {get_llm_scheduler().stats()}")
         logger.info("All scenarios processed successfully!")
         return 0
         
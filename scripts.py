@@ -10,10 +10,13 @@ Features:
 - Support for different response types (text/yes_no_maybe)
 - Automated testing of the complete agentic workflow
 - Export results as markdown files
+- Optional worker pool running simulations concurrently, with the number of
+  in-flight LLM requests bounded process-wide by llm_scheduler
 
 Usage:
     python scripts.py --scenario "25 year old with high blood pressure" --response_type yes_no_maybe
     python scripts.py --scenario "45 year old female with diabetes" --output_dir results
+    python scripts.py --num_simulations 10 --workers 4 --max_in_flight 4
 """
 
 import os
@@ -23,7 +26,9 @@ import argparse
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Dict, Any, Callable, Iterator, Optional
 import time
 import random
 
@@ -31,16 +36,20 @@ import random
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from dotenv import load_dotenv
-from crewai import Agent, Task, Crew, Process
-from crewai.llm import LLM
+from crewai import Agent
 
 # Import from main application
 from propmpts import (
     questions_list, qna_agent_prompt, research_agent_prompt, 
     diagnostic_agent_prompt, critique_agent_prompt, presentation_agent_prompt
 )
+from patient_parser import parse_patient_responses, LOCAL_PARSE_ENABLED
+from routing import decide_route, ROUTING_ENABLED
+from pipeline import CrewTemplates, crew_inputs, SELECTABLE_PROFILES, DEFAULT_PIPELINE_PROFILE
+from llm_cache import llm_cache_sample, get_llm_cache, LLM_CACHE_MODES, LLM_CACHE_MODE
+from llm_scheduler import get_llm_scheduler, LLM_MAX_IN_FLIGHT
 from main import (
-    get_llm, load_patient_data, search_medical_knowledge
+    get_llm, get_research_inputs, search_medical_knowledge, search_medical_knowledge_batch
 )
 
 # Load environment variables
@@ -60,8 +69,8 @@ logger = logging.getLogger(__name__)
 class CKDTestScenarioGenerator:
     """Generate test scenarios for CKD assessment using LLM"""
     
-    def __init__(self, llm_provider="groq", model="llama"):
-        self.llm = get_llm(llm_provider, model)
+    def __init__(self, llm_provider="groq", model="llama", llm_cache_mode=None):
+        self.llm = get_llm(llm_provider, model, llm_cache_mode)
         self.questions = self._parse_questions()
         logger.info(f"Initialized scenario generator with {llm_provider}/{model}")
         logger.info(f"Loaded {len(self.questions)} questions for testing")
@@ -228,10 +237,16 @@ Return JSON array format:
 class CKDAgentWorkflowTester:
     """Test the CKD assessment agentic workflow"""
     
-    def __init__(self, llm_provider="groq", model="llama"):
-        self.llm = get_llm(llm_provider, model)
+    def __init__(self, llm_provider="groq", model="llama", local_parse=LOCAL_PARSE_ENABLED, routing=ROUTING_ENABLED,
+                 profile=DEFAULT_PIPELINE_PROFILE, llm_cache_mode=None):
+        self.llm = get_llm(llm_provider, model, llm_cache_mode)
         self.provider = llm_provider
         self.model = model
+        self.local_parse = local_parse
+        self.routing = routing
+        self.profile = profile
+        # Crews are built once per task plan and copied for every assessment
+        self.crew_templates = CrewTemplates()
         
         # Configure embeddings to match LLM provider
         if llm_provider == "groq":
@@ -251,7 +266,7 @@ class CKDAgentWorkflowTester:
                 }
             }
         
-        logger.info(f"Initialized workflow tester with {llm_provider}/{model}")
+        logger.info(f"Initialized workflow tester with {llm_provider}/{model} and the {profile} pipeline profile")
         logger.info(f"Using embedder: {self.embedder_config['provider']}")
     
     def run_assessment(self, qna_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -263,22 +278,30 @@ class CKDAgentWorkflowTester:
             # Prepare collected answers
             collected_answers_json = json.dumps(qna_data['qna_responses'], indent=2)
             
-            # Create agents and tasks
-            agents = self._create_agents(collected_answers_json)
-            tasks = self._create_tasks(*agents, collected_answers_json)
+            # Structure the answers locally so the QnA agent task can be skipped
+            parsed_patient = parse_patient_responses(qna_data['qna_responses'])
+            if not parsed_patient.complete:
+                logger.info(f"Local parsing incomplete ({', '.join(parsed_patient.unparsed_fields)}) - keeping the QnA agent task")
             
-            # Create and run crew with matching embedder
-            crew = Crew(
-                agents=agents,
-                tasks=tasks,
+            # Clear-cut low-risk cases take a shortened pipeline
+            route = decide_route(parsed_patient, enabled=self.routing)
+            
+            # Copy of the crew template for this task plan, with matching embedder
+            parsed_complete = self.local_parse and parsed_patient.complete
+            crew = self.crew_templates.get(
+                (self.provider, self.model), self._create_agents, parsed_complete, route["route"], self.profile,
                 verbose=False,
-                process=Process.sequential,
                 memory=False if self.provider == "groq" else True,  # Disable memory for Groq to avoid embedding issues
                 embedder=self.embedder_config if self.provider != "groq" else None  # Only use embedder for OpenAI
             )
+            agents, tasks = crew.agents, crew.tasks
+            
+            # Fill the patient-specific placeholders of the agents and tasks
+            inputs = crew_inputs(collected_answers_json, parsed_patient if parsed_complete else None,
+                                 **get_research_inputs(collected_answers_json, self.provider))
             
             logger.info("Running CrewAI workflow...")
-            result = crew.kickoff()
+            result = crew.kickoff(inputs=inputs)
             
             # Extract result content
             if hasattr(result, 'raw'):
@@ -294,11 +317,15 @@ class CKDAgentWorkflowTester:
                 "qna_responses": qna_data['qna_responses'],
                 "assessment_result": result_content,
                 "processing_time_seconds": round(duration, 2),
+                "route": route,
                 "agent_config": {
                     "llm_provider": self.provider,
                     "llm_model": self.model,
                     "total_agents": len(agents),
-                    "total_tasks": len(tasks)
+                    "total_tasks": len(tasks),
+                    "pipeline_profile": self.profile,
+                    "expected_llm_calls": len(tasks),
+                    "local_parse": parsed_complete
                 }
             }
             
@@ -314,11 +341,8 @@ class CKDAgentWorkflowTester:
                 "processing_time_seconds": time.time() - start_time
             }
     
-    def _create_agents(self, collected_patient_data: str):
-        """Create agents for workflow"""
-        # Load patient data
-        past_patient_qna, present_patient_qna = load_patient_data()
-        
+    def _create_agents(self):
+        """Create agents for workflow; patient-specific prompt parts are filled in at kickoff"""
         # Create agents
         qna_agent = Agent(
             role="QnA Agent",
@@ -331,14 +355,10 @@ class CKDAgentWorkflowTester:
         research_agent = Agent(
             role="Research Agent",
             goal="Research CKD and assess risk percentage based on patient responses",
-            backstory=research_agent_prompt.format(
-                past_patient_qna=past_patient_qna, 
-                present_patient_qna=present_patient_qna,
-                current_patient_responses=collected_patient_data
-            ),
+            backstory=research_agent_prompt,
             verbose=False,
             llm=self.llm,
-            tools=[search_medical_knowledge]
+            tools=[search_medical_knowledge_batch, search_medical_knowledge]
         )
         
         diagnostic_agent = Agent(
@@ -366,45 +386,6 @@ class CKDAgentWorkflowTester:
         )
         
         return qna_agent, research_agent, diagnostic_agent, critique_agent, presentation_agent
-    
-    def _create_tasks(self, qna_agent, research_agent, diagnostic_agent, critique_agent, presentation_agent, collected_patient_data):
-        """Create tasks for workflow"""
-        
-        collect_info_task = Task(
-            description=f"Process and validate patient responses: {collected_patient_data}",
-            agent=qna_agent,
-            expected_output="Structured patient questionnaire responses"
-        )
-        
-        diagnostic_task = Task(
-            description="Analyze patient responses for kidney issues",
-            agent=diagnostic_agent,
-            dependencies=[collect_info_task],
-            expected_output="Diagnostic analysis of patient data"
-        )
-        
-        research_task = Task(
-            description="Conduct comprehensive CKD risk assessment with factor analysis",
-            agent=research_agent,
-            dependencies=[collect_info_task, diagnostic_task],
-            expected_output="CKD risk assessment with detailed factors"
-        )
-        
-        critique_task = Task(
-            description="Review CKD risk assessment for accuracy",
-            agent=critique_agent,
-            dependencies=[research_task],
-            expected_output="Verified CKD assessment"
-        )
-        
-        presentation_task = Task(
-            description="Create patient-friendly CKD assessment report",
-            agent=presentation_agent,
-            dependencies=[critique_task],
-            expected_output="User-friendly CKD assessment report"
-        )
-        
-        return [collect_info_task, diagnostic_task, research_task, critique_task, presentation_task]
 
 class ResultsExporter:
     """Export testing results to markdown files"""
@@ -465,6 +446,8 @@ class ResultsExporter:
 - **LLM Provider:** {assessment_result['agent_config']['llm_provider']}
 - **LLM Model:** {assessment_result['agent_config']['llm_model']}
 - **Total Agents:** {assessment_result['agent_config']['total_agents']}
+- **Pipeline Profile:** {assessment_result['agent_config'].get('pipeline_profile', 'full')} ({assessment_result['agent_config'].get('expected_llm_calls', 'n/a')} LLM calls expected)
+- **Pipeline Route:** {assessment_result.get('route', {}).get('route', 'full')} ({assessment_result.get('route', {}).get('reason', 'not recorded')})
 
 ## Patient Responses Summary
 
@@ -610,6 +593,56 @@ class SimulationResultsAggregator:
         
         return str(filepath)
 
+def run_simulation(generator: CKDTestScenarioGenerator, tester: CKDAgentWorkflowTester, exporter: ResultsExporter,
+                   scenario: str, sim_num: int, response_type: str = "text",
+                   metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Generate responses for one simulation, assess and export them
+
+    Args:
+        sim_num: 1-based simulation number, also the LLM cache sample
+        metadata: Extra fields stored in the result, e.g. scenario parameters
+    """
+    logger.info(f"Running simulation {sim_num}: {scenario}")
+    
+    # Each simulation keeps its own cached LLM responses
+    with llm_cache_sample(sim_num):
+        qna_data = generator.generate_responses(scenario, response_type)
+        assessment_result = tester.run_assessment(qna_data)
+    
+    assessment_result['simulation_number'] = sim_num
+    if metadata:
+        assessment_result.update(metadata)
+    
+    output_file = exporter.export_assessment(assessment_result)
+    logger.info(f"Simulation {sim_num} completed. Results saved to: {output_file}")
+    return assessment_result
+
+def iter_simulations(jobs: List[Callable[[], Dict[str, Any]]], workers: int = 1) -> Iterator[Dict[str, Any]]:
+    """Yield the results of simulation jobs in job order
+
+    With one worker each job runs when its result is requested, exactly like
+    a serial loop. With more workers all jobs are submitted to a thread pool
+    up front and each result is yielded as soon as it and every earlier one
+    are done; jobs not yet started are cancelled if the caller stops early.
+    """
+    if workers <= 1:
+        for job in jobs:
+            yield job()
+        return
+    logger.info(f"Running {len(jobs)} simulations with {workers} workers "
+                f"and at most {get_llm_scheduler().max_in_flight} LLM requests in flight")
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="simulation")
+    try:
+        futures = [pool.submit(job) for job in jobs]
+        for future in futures:
+            yield future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def run_simulations(jobs: List[Callable[[], Dict[str, Any]]], workers: int = 1) -> List[Dict[str, Any]]:
+    """Run simulation jobs, concurrently if workers > 1, and return their results in job order"""
+    return list(iter_simulations(jobs, workers))
+
 def parse_args():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description="CKD Assessment Testing Script")
@@ -627,6 +660,18 @@ def parse_args():
                        help='Number of simulations to run with different responses')
     parser.add_argument('--analyze', action='store_true',
                        help='Run analysis after generating results')
+    parser.add_argument('--no_local_parse', action='store_true', default=not LOCAL_PARSE_ENABLED,
+                       help='Always run the QnA agent task instead of parsing answers locally (default from CKD_LOCAL_PARSE)')
+    parser.add_argument('--no_routing', action='store_true', default=not ROUTING_ENABLED,
+                       help='Always run the full agent pipeline, even for clear low-risk cases (default from CKD_ROUTING)')
+    parser.add_argument('--profile', choices=SELECTABLE_PROFILES, default=DEFAULT_PIPELINE_PROFILE,
+                       help='Pipeline profile of the assessment crew')
+    parser.add_argument('--llm_cache', choices=LLM_CACHE_MODES, default=LLM_CACHE_MODE,
+                       help='LLM response cache mode')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Number of simulations to run concurrently')
+    parser.add_argument('--max_in_flight', type=int, default=LLM_MAX_IN_FLIGHT,
+                       help='Maximum number of concurrent LLM requests across all workers')
     
     return parser.parse_args()
 
@@ -643,37 +688,18 @@ def main():
     
     try:
         # Initialize components
-        generator = CKDTestScenarioGenerator(args.llm_provider, args.model)
-        tester = CKDAgentWorkflowTester(args.llm_provider, args.model)
+        generator = CKDTestScenarioGenerator(args.llm_provider, args.model, args.llm_cache)
+        tester = CKDAgentWorkflowTester(args.llm_provider, args.model, local_parse=not args.no_local_parse, routing=not args.no_routing,
+                                        profile=args.profile, llm_cache_mode=args.llm_cache)
         exporter = ResultsExporter(args.output_dir)
         aggregator = SimulationResultsAggregator(args.output_dir)
         
-        # Store all assessment results
-        all_assessment_results = []
+        get_llm_scheduler().set_max_in_flight(args.max_in_flight)
         
-        # Run multiple simulations
-        for sim_num in range(args.num_simulations):
-            logger.info(f"Running simulation {sim_num + 1}/{args.num_simulations}")
-            
-            # Generate responses
-            logger.info("Generating patient responses...")
-            qna_data = generator.generate_responses(args.scenario, args.response_type)
-            
-            # Run assessment
-            logger.info("Running CKD assessment...")
-            assessment_result = tester.run_assessment(qna_data)
-            
-            # Add simulation number to result
-            assessment_result['simulation_number'] = sim_num + 1
-            
-            # Export individual results
-            logger.info("Exporting results...")
-            output_file = exporter.export_assessment(assessment_result)
-            
-            # Store result for aggregation
-            all_assessment_results.append(assessment_result)
-            
-            logger.info(f"Simulation {sim_num + 1} completed. Results saved to: {output_file}")
+        # Run multiple simulations; results keep their simulation order
+        jobs = [partial(run_simulation, generator, tester, exporter, args.scenario, sim_num, args.response_type)
+                for sim_num in range(1, args.num_simulations + 1)]
+        all_assessment_results = run_simulations(jobs, args.workers)
         
         # Generate consolidated reports
         if args.num_simulations > 1:
@@ -690,6 +716,9 @@ def main():
                 analyzer.export_analysis(analysis, args.scenario)
                 logger.info("Analysis completed and exported")
         
+        logger.info(f"LLM response cache: {get_llm_cache().stats()}")
+        logger.info(f"Crew templates: {tester.crew_templates.builds} built, {tester.crew_templates.reuses} reused")
+        logger.info(f"LLM scheduler: {get_llm_scheduler().stats()}")
         logger.info(f"All {args.num_simulations} simulations completed successfully!")
         return 0
         
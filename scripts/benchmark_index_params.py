@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+CKD Index Parameter Sweep Benchmark
+
+This script builds throwaway Chroma indexes over the ./data sources for a
+grid of chunking and HNSW parameters and measures each of them against a
+fixed set of CKD queries labelled with the sources expected to answer them.
+
+Features:
+- Sweep of chunk size, chunk overlap, HNSW M and HNSW search ef
+- Build time, on-disk index size and p50/p95 query latency per setting
+- recall@k for every requested k: the share of a query's expected sources
+  that appear among its top-k chunks, averaged over all queries
+- Source files are parsed once and chunk embeddings come from the
+  persistent embedding cache, so only new chunk texts are embedded
+
+Expected sources are labelled at file level (file name without extension).
+Pass --queries with a JSON list of {"query": ..., "expected_sources": [...]}
+objects to benchmark a different labelled set.
+
+Usage:
+    python scripts/benchmark_index_params.py --provider groq
+    python scripts/benchmark_index_params.py --provider groq --chunk-sizes 500 1000 --overlaps 100 --m 16 32 --ef 10 50 --k 3 5
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+import itertools
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.vectorstores import Chroma
+
+# Add the project root to the path so we can import the knowledge base
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from knowledge_base import get_embeddings, list_source_files, load_source_file, CHUNK_SIZE, CHUNK_OVERLAP
+from chunk_store import chunk_hash
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+PEDIATRICIANS = "KDIGO-2024-CKD-Guideline-Key-Takeaways-for-Pediatricians"
+NEPHROLOGISTS = "KDIGO-2024-CKD-Guideline-Top-10-Takeaways-for-Nephrologists-Evaluation"
+PCPS = "KDIGO-2024-CKD-Guideline-Top-10-Takeaways-for-PCPs-Evaluation"
+CKD_INFO = "ckd_info"
+GLOBAL_BURDEN = "gfac199"
+
+LABELLED_QUERIES = [
+    {"query": "eGFR thresholds for CKD stages 1 to 5", "expected_sources": [CKD_INFO, PCPS, NEPHROLOGISTS]},
+    {"query": "risk factors for chronic kidney disease", "expected_sources": [CKD_INFO, PCPS]},
+    {"query": "symptoms of CKD such as swelling, itching and shortness of breath", "expected_sources": [CKD_INFO]},
+    {"query": "how CKD is diagnosed with blood and urine tests", "expected_sources": [CKD_INFO, PCPS]},
+    {"query": "CKD in children and adolescents", "expected_sources": [PEDIATRICIANS]},
+    {"query": "when to refer a patient to a nephrologist", "expected_sources": [PCPS, NEPHROLOGISTS]},
+    {"query": "SGLT2 inhibitors in type 2 diabetes with CKD", "expected_sources": [NEPHROLOGISTS, PCPS]},
+    {"query": "albuminuria ACR categories A1 A2 A3", "expected_sources": [PCPS, NEPHROLOGISTS, PEDIATRICIANS]},
+    {"query": "risk prediction equations for kidney failure", "expected_sources": [NEPHROLOGISTS, PCPS]},
+    {"query": "blood pressure targets for patients with chronic kidney disease", "expected_sources": [NEPHROLOGISTS, PCPS, PEDIATRICIANS]},
+    {"query": "global burden and prevalence of chronic kidney disease", "expected_sources": [GLOBAL_BURDEN]},
+    {"query": "cystatin C and creatinine based GFR estimation", "expected_sources": [NEPHROLOGISTS, PCPS, PEDIATRICIANS]}
+]
+
+def _directory_size(path: str) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+def _percentile_ms(latencies: List[float], percentile: float) -> float:
+    return round(float(np.percentile(latencies, percentile)) * 1000, 3)
+
+def _source_label(metadata: Dict[str, Any]) -> str:
+    return os.path.splitext(os.path.basename(metadata.get("source", "")))[0]
+
+def split_sources(pages: List[Any], chunk_size: int, chunk_overlap: int) -> List[Any]:
+    """Split the loaded source pages into unique chunks"""
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = {}
+    for chunk in text_splitter.split_documents(pages):
+        key = chunk_hash(chunk.metadata.get("source", ""), chunk.metadata.get("page"), chunk.page_content)
+        chunks.setdefault(key, chunk)
+    return list(chunks.items())
+
+def build_index(work_dir: str, chunks: List[Any], vectors: List[List[float]], embeddings, m: int,
+                construction_ef: int, search_ef: int) -> Dict[str, Any]:
+    """Build a throwaway Chroma index with the given HNSW parameters and time it"""
+    index_dir = tempfile.mkdtemp(prefix="index_", dir=work_dir)
+    start_time = time.perf_counter()
+    vector_store = Chroma(
+        persist_directory=index_dir,
+        embedding_function=embeddings,
+        collection_metadata={"hnsw:M": m, "hnsw:construction_ef": construction_ef, "hnsw:search_ef": search_ef}
+    )
+    collection = vector_store._collection
+    for start in range(0, len(chunks), 1000):
+        batch = chunks[start:start + 1000]
+        collection.add(
+            ids=[key for key, _ in batch],
+            embeddings=vectors[start:start + 1000],
+            documents=[chunk.page_content for _, chunk in batch],
+            metadatas=[chunk.metadata for _, chunk in batch]
+        )
+    vector_store.persist()
+    build_seconds = time.perf_counter() - start_time
+    return {"vector_store": vector_store, "index_dir": index_dir, "build_seconds": build_seconds}
+
+def measure_queries(vector_store, query_embeddings: List[List[float]], queries: List[Dict[str, Any]],
+                    k: int, repeats: int) -> Dict[str, Any]:
+    """Time the queries at one k and compute recall@k against the expected sources"""
+    collection = vector_store._collection
+    latencies = []
+    recalls = []
+    for embedding, labelled in zip(query_embeddings, queries):
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            result = collection.query(query_embeddings=[embedding], n_results=k, include=["metadatas"])
+            latencies.append(time.perf_counter() - start_time)
+        found = {_source_label(metadata or {}) for metadata in result["metadatas"][0]}
+        expected = set(labelled["expected_sources"])
+        recalls.append(len(found & expected) / max(len(expected), 1))
+
+    return {
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+        "recall_at_k": round(float(np.mean(recalls)), 3)
+    }
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="CKD Index Parameter Sweep Benchmark")
+
+    parser.add_argument('--provider', choices=['groq', 'openai'],
+                       default='groq', help='Provider whose embedding model to use')
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[500, CHUNK_SIZE, 1500],
+                       help='Chunk sizes to sweep')
+    parser.add_argument('--overlaps', type=int, nargs='+', default=[50, CHUNK_OVERLAP, 200],
+                       help='Chunk overlaps to sweep')
+    parser.add_argument('--m', type=int, nargs='+', default=[8, 16, 32],
+                       help='HNSW M values to sweep')
+    parser.add_argument('--ef', type=int, nargs='+', default=[10, 50, 100],
+                       help='HNSW search ef values to sweep')
+    parser.add_argument('--construction-ef', type=int, default=100,
+                       help='HNSW construction ef used for every build')
+    parser.add_argument('--k', type=int, nargs='+', default=[3, 5, 10],
+                       help='Result counts to measure recall and latency at')
+    parser.add_argument('--repeats', type=int, default=5,
+                       help='Timed repetitions of every query')
+    parser.add_argument('--queries', type=str,
+                       help='JSON file with labelled queries to use instead of the built-in set')
+    parser.add_argument('--output_dir', type=str, default='output/benchmarks',
+                       help='Directory to save the results CSV')
+
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+
+    try:
+        queries = LABELLED_QUERIES
+        if args.queries:
+            with open(args.queries, "r", encoding="utf-8") as f:
+                queries = json.load(f)
+
+        embeddings = get_embeddings(args.provider)
+        query_embeddings = embeddings.embed_queries([labelled["query"] for labelled in queries])
+
+        # Parse every source file once; only the splitting is repeated per setting
+        pages = []
+        for path in list_source_files():
+            pages.extend(load_source_file(path))
+        logger.info(f"Loaded {len(pages)} pages; sweeping {len(args.chunk_sizes) * len(args.overlaps)} chunkings x {len(args.m) * len(args.ef)} HNSW settings")
+
+        results = []
+        work_dir = tempfile.mkdtemp(prefix="ckd_sweep_")
+        try:
+            for chunk_size, chunk_overlap in itertools.product(args.chunk_sizes, args.overlaps):
+                if chunk_overlap >= chunk_size:
+                    logger.warning(f"Skipping chunk size {chunk_size} with overlap {chunk_overlap}")
+                    continue
+                start_time = time.perf_counter()
+                chunks = split_sources(pages, chunk_size, chunk_overlap)
+                split_seconds = time.perf_counter() - start_time
+                vectors = embeddings.embed_documents([chunk.page_content for _, chunk in chunks])
+
+                for m, search_ef in itertools.product(args.m, args.ef):
+                    built = build_index(work_dir, chunks, vectors, embeddings, m, args.construction_ef, search_ef)
+                    index_bytes = _directory_size(built["index_dir"])
+                    for k in args.k:
+                        results.append({
+                            "chunk_size": chunk_size,
+                            "chunk_overlap": chunk_overlap,
+                            "hnsw_m": m,
+                            "hnsw_ef": search_ef,
+                            "k": k,
+                            "chunks": len(chunks),
+                            "split_seconds": round(split_seconds, 3),
+                            "build_seconds": round(built["build_seconds"], 3),
+                            "index_bytes": index_bytes,
+                            **measure_queries(built["vector_store"], query_embeddings, queries, k, args.repeats)
+                        })
+                    logger.info(f"Measured chunk_size={chunk_size} overlap={chunk_overlap} M={m} ef={search_ef}")
+                    shutil.rmtree(built["index_dir"], ignore_errors=True)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        header = ["chunk_size", "chunk_overlap", "hnsw_m", "hnsw_ef", "k", "chunks", "split_seconds",
+                  "build_seconds", "index_bytes", "p50_ms", "p95_ms", "recall_at_k"]
+        print("\n| " + " | ".join(header) + " |")
+        print("|" + "---|" * len(header))
+        for result in results:
+            print("| " + " | ".join(str(result[column]) for column in header) + " |")
+
+        output_dir = Path(args.output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_file = output_dir / f"index_params_{args.provider}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        with open(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=header)
+            writer.writeheader()
+            writer.writerows(results)
+
+        logger.info(f"Benchmark results saved to: {output_file}")
+        return 0
+
+    except Exception as e:
+        logger.error(f"Benchmark failed: {e}")
+        return 1
+
+if __name__ == "__main__":
+    exit(main())
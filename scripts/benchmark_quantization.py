@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+CKD Vector Index Quantization Benchmark
+
+This script compares the current Chroma vector store of a provider with
+NumPy index exports in float32, float16 and int8, with and without exact
+re-scoring of the top candidates.
+
+Features:
+- Memory footprint of the matrix scanned by every query
+- p50/p95 query latency over a fixed set of CKD queries
+- Top-k overlap with the results of the current Chroma store
+
+Usage:
+    python scripts/benchmark_quantization.py --provider groq
+    python scripts/benchmark_quantization.py --provider openai --k 5 --repeats 20
+"""
+
+import os
+import sys
+import csv
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any
+
+import numpy as np
+
+# Add the project root to the path so we can import the knowledge base
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from knowledge_base import initialize_vector_store, get_embeddings, get_vector_store_path
+from numpy_index import NumpyIndex, export_numpy_index
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+BENCHMARK_QUERIES = [
+    "hypertension CKD risk",
+    "eGFR thresholds for CKD staging G3a G3b",
+    "albuminuria ACR categories A1 A2 A3",
+    "SGLT2 inhibitors in type 2 diabetes with CKD",
+    "blood pressure targets for patients with chronic kidney disease",
+    "cardiovascular disease and kidney function decline",
+    "when to refer a patient to a nephrologist",
+    "CKD in children and adolescents",
+    "pedal edema fluid overload kidney disease",
+    "hematuria evaluation",
+    "nocturia and reduced urine output as kidney symptoms",
+    "fatigue and anemia in chronic kidney disease",
+    "metallic taste nausea uremia",
+    "risk of CKD progression prediction equations",
+    "type 1 diabetes kidney screening frequency",
+    "dietary protein and sodium intake recommendations CKD"
+]
+
+VARIANTS = [
+    ("float32", False),
+    ("float16", False),
+    ("float16", True),
+    ("int8", False),
+    ("int8", True)
+]
+
+def _directory_size(path: str) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+def _percentile_ms(latencies: List[float], percentile: float) -> float:
+    return round(float(np.percentile(latencies, percentile)) * 1000, 3)
+
+def benchmark_chroma(vector_store, store_dir: str, query_embeddings: List[List[float]], k: int, repeats: int) -> Dict[str, Any]:
+    """Time the current Chroma store and collect its top-k ids as the reference"""
+    collection = vector_store._collection
+    latencies = []
+    reference = []
+    for embedding in query_embeddings:
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            result = collection.query(query_embeddings=[embedding], n_results=k, include=["distances"])
+            latencies.append(time.perf_counter() - start_time)
+        reference.append(result["ids"][0])
+
+    count = collection.count()
+    dim = len(query_embeddings[0])
+    return {
+        "variant": "chroma (current)",
+        "scan_bytes": count * dim * 4,
+        "disk_bytes": _directory_size(store_dir),
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+        "topk_overlap": 1.0,
+        "reference": reference
+    }
+
+def benchmark_numpy(index: NumpyIndex, label: str, index_dir: str, query_embeddings: List[List[float]],
+                    reference: List[List[str]], k: int, repeats: int) -> Dict[str, Any]:
+    """Time a NumPy index variant and measure its overlap with the reference ids"""
+    latencies = []
+    overlaps = []
+    for embedding, expected in zip(query_embeddings, reference):
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            rows = index.search_by_vector(embedding, k)
+            latencies.append(time.perf_counter() - start_time)
+        found = {index.ids[row] for row, _ in rows}
+        overlaps.append(len(found & set(expected)) / max(len(expected), 1))
+
+    return {
+        "variant": label,
+        "scan_bytes": index.memory_footprint(),
+        "disk_bytes": _directory_size(index_dir),
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+        "topk_overlap": round(float(np.mean(overlaps)), 3)
+    }
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="CKD Vector Index Quantization Benchmark")
+
+    parser.add_argument('--provider', choices=['groq', 'openai'],
+                       default='groq', help='Provider whose vector store to benchmark')
+    parser.add_argument('--k', type=int, default=5,
+                       help='Number of results per query')
+    parser.add_argument('--repeats', type=int, default=10,
+                       help='Timed repetitions of every query')
+    parser.add_argument('--output_dir', type=str, default='output/benchmarks',
+                       help='Directory to save the results CSV')
+
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+
+    try:
+        vector_store = initialize_vector_store(args.provider)
+        embeddings = get_embeddings(args.provider)
+        query_embeddings = [embeddings.embed_query(query) for query in BENCHMARK_QUERIES]
+        logger.info(f"Benchmarking {len(BENCHMARK_QUERIES)} queries against {get_vector_store_path(args.provider)}")
+
+        chroma_result = benchmark_chroma(vector_store, get_vector_store_path(args.provider), query_embeddings, args.k, args.repeats)
+        reference = chroma_result.pop("reference")
+        results = [chroma_result]
+
+        work_dir = tempfile.mkdtemp(prefix="ckd_quant_")
+        try:
+            for dtype, rescore in VARIANTS:
+                index_dir = os.path.join(work_dir, dtype)
+                if not os.path.exists(index_dir):
+                    export_numpy_index(vector_store, index_dir, dtype=dtype, keep_full_precision=True)
+                index = NumpyIndex(index_dir, rescore=rescore)
+                label = f"numpy {dtype}" + (" + rescore" if rescore else "")
+                results.append(benchmark_numpy(index, label, index_dir, query_embeddings, reference, args.k, args.repeats))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        header = ["variant", "scan_bytes", "disk_bytes", "p50_ms", "p95_ms", "topk_overlap"]
+        print("\n| " + " | ".join(header) + " |")
+        print("|" + "---|" * len(header))
+        for result in results:
+            print("| " + " | ".join(str(result[column]) for column in header) + " |")
+
+        output_dir = Path(args.output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_file = output_dir / f"quantization_{args.provider}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        with open(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=header)
+            writer.writeheader()
+            writer.writerows(results)
+
+        logger.info(f"Benchmark results saved to: {output_file}")
+        return 0
+
+    except Exception as e:
+        logger.error(f"Benchmark failed: {e}")
+        return 1
+
+if __name__ == "__main__":
+    exit(main())